@@ -1,25 +1,46 @@
 import streamlit as st
-import pandas as pd
 import os
 
 # Import utility modules
-from utils.data_loader import get_book_titles_starting_with
 from utils.ui_components import (
     apply_custom_css,
     create_header,
     create_recommendation_grid,
+    create_show_more_button,
     create_model_selection_buttons,
     create_search_box,
     create_description_search_box,
+    create_reader_search_box,
+    create_query_metrics,
+    create_model_registry_stats,
     create_footer,
     create_divider,
 )
-from utils.image_fetcher import cache_book_covers
 
-# Import recommendation models
-from models.knn_model import find_similar_books_knn
-from models.correlation_model import find_similar_books_correlation
-from models.content_model import find_similar_books_content, find_books_by_description
+# Recommendation models are loaded lazily through the registry
+from models import (
+    DESCRIPTION_BACKEND,
+    DESCRIPTION_MODELS,
+    fetch_more,
+    get_recommender,
+)
+from models.executor import get_query_executor
+from utils.model_registry import get_model_registry
+
+# Recommendations shown per page, "Show More" fetches the next page
+PAGE_SIZE = 10
+
+
+# pandas is only needed once the user starts typing a title
+def search_book_titles(prefix):
+    from utils.data_loader import get_book_titles_starting_with
+
+    return get_book_titles_starting_with(prefix)
+
+
+def show_more_recommendations():
+    fetch_more(st.session_state.recommendations, PAGE_SIZE)
+
 
 # Create assets directory if it doesn't exist
 os.makedirs("assets", exist_ok=True)
@@ -39,15 +60,15 @@ apply_custom_css("assets/custom.css")
 # Create header
 create_header()
 
-# Initialize session state for storing recommendations
+# Initialize session state for storing compact recommendation results
 if "recommendations" not in st.session_state:
-    st.session_state.recommendations = pd.DataFrame()
+    st.session_state.recommendations = None
 
 if "active_model" not in st.session_state:
     st.session_state.active_model = None
 
 # Create search box
-book_title = create_search_box(get_book_titles_starting_with)
+book_title = create_search_box(search_book_titles)
 
 # Create model selection buttons
 knn_button, correlation_button, content_button = create_model_selection_buttons()
@@ -59,6 +80,7 @@ if st.session_state.active_model:
         "correlation": "Pearson Correlation",
         "content": "Content-Based",
         "description": "Description-Based",
+        "reader": "For This Reader",
     }
     st.markdown(
         f"<p style='color: #3581B8; font-weight: bold;'>Active Model: {model_names.get(st.session_state.active_model, 'Unknown')}</p>",
@@ -71,39 +93,61 @@ create_divider()
 # Create description search box
 description, description_search_button = create_description_search_box()
 
+create_divider()
+
+# Create reader search box
+reader, reader_search_button = create_reader_search_box()
+
 # Handle model button clicks
 if knn_button:
     st.session_state.active_model = "knn"
     if book_title:
-        st.session_state.recommendations = find_similar_books_knn(book_title)
+        st.session_state.recommendations = get_recommender("knn")(book_title, PAGE_SIZE)
 
 if correlation_button:
     st.session_state.active_model = "correlation"
     if book_title:
-        st.session_state.recommendations = find_similar_books_correlation(book_title)
+        st.session_state.recommendations = get_recommender("correlation")(
+            book_title, PAGE_SIZE
+        )
 
 if content_button:
     st.session_state.active_model = "content"
     if book_title:
-        st.session_state.recommendations = find_similar_books_content(book_title)
+        st.session_state.recommendations = get_recommender("content")(
+            book_title, PAGE_SIZE
+        )
 
 # Handle description search
 if description_search_button and description:
-    st.session_state.recommendations = find_books_by_description(description)
+    st.session_state.recommendations = get_recommender(
+        DESCRIPTION_MODELS[DESCRIPTION_BACKEND]
+    )(description, PAGE_SIZE)
     st.session_state.active_model = "description"
 
+# Handle reader search
+if reader_search_button and reader:
+    st.session_state.recommendations = get_recommender("reader")(reader, PAGE_SIZE)
+    st.session_state.active_model = "reader"
+
 
 # Display recommendations
-if not st.session_state.recommendations.empty:
+if st.session_state.recommendations:
     st.markdown("<h2>Recommended Books</h2>", unsafe_allow_html=True)
 
-    # Pre-cache book covers for better performance
-    if "ISBN" in st.session_state.recommendations.columns:
-        cache_book_covers(st.session_state.recommendations["ISBN"].tolist())
-
     # Display recommendations in a grid
     create_recommendation_grid(st.session_state.recommendations, cols=2)
 
+    if st.session_state.recommendations.has_more:
+        create_show_more_button(show_more_recommendations)
+
+
+# Queue depth and wait times of the shared query executor
+create_query_metrics(get_query_executor().metrics())
+
+# Resident size, load time and hits of every loaded model and dataset
+registry = get_model_registry()
+create_model_registry_stats(registry.summary(), registry.stats())
 
 # Create footer
 create_footer()
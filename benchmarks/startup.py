@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should stay unloaded until a recommendation is requested
+HEAVY_MODULES = ["sklearn", "scipy", "PIL", "requests"]
+
+# Runs in a fresh interpreter so every measurement is a cold start
+PROBE = """
+import json, sys, time
+
+start = time.perf_counter()
+import streamlit
+streamlit_import = time.perf_counter() - start
+
+start = time.perf_counter()
+import utils.ui_components, models
+app_import = time.perf_counter() - start
+
+from streamlit.testing.v1 import AppTest
+
+start = time.perf_counter()
+at = AppTest.from_file("app.py", default_timeout=60).run()
+first_render = time.perf_counter() - start
+
+print(json.dumps({
+    "streamlit_import_s": streamlit_import,
+    "app_import_s": app_import,
+    "first_render_s": first_render,
+    "header_rendered": any("Book Recommendation System" in m.value for m in at.markdown),
+    "exceptions": [str(e.value) for e in at.exception],
+    "heavy_modules_loaded": sorted(
+        name for name in %r if name in sys.modules
+    ),
+}))
+"""
+
+
+def run_probe():
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE % HEAVY_MODULES],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_times(module):
+    # Cumulative import time per top-level package, wherever it was first
+    # imported, from -X importtime
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        name = name.strip()
+        if "." not in name and not name.startswith("_"):
+            times[name] = max(times.get(name, 0), int(cumulative) / 1e6)
+
+    return sorted(times.items(), key=lambda item: item[1], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark for app.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    print("Slowest top-level imports for the app modules:")
+    for name, seconds in import_times("utils.ui_components, models")[
+        : args.top
+    ]:
+        print(f"  {name:<30} {seconds * 1000:8.1f} ms")
+
+    runs = [run_probe() for _ in range(args.runs)]
+
+    print(f"\nCold starts over {args.runs} runs (median):")
+    for run in runs:
+        run["time_to_first_render_s"] = (
+            run["streamlit_import_s"] + run["app_import_s"] + run["first_render_s"]
+        )
+    for key in [
+        "streamlit_import_s",
+        "app_import_s",
+        "first_render_s",
+        "time_to_first_render_s",
+    ]:
+        print(f"  {key:<30} {statistics.median(r[key] for r in runs) * 1000:8.1f} ms")
+
+    last = runs[-1]
+    print(f"  {'header_rendered':<30} {last['header_rendered']}")
+    print(f"  {'heavy_modules_loaded':<30} {last['heavy_modules_loaded'] or 'none'}")
+    for exception in last["exceptions"]:
+        print(f"  exception: {exception}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,132 @@
 # Initialize models package
+import importlib
+import os
+
+# Recommendation entry point, shared catalog and the catalog row of every ISBN
+# id by model id. Models without catalog rows hydrate their result codes
+# themselves, from the card fields stored with their index. Modules are
+# imported on first use so that scikit-learn and SciPy are not loaded before
+# the first render.
+MODEL_REGISTRY = {
+    "knn": (
+        "models.knn_model",
+        "find_similar_books_knn",
+        "get_knn_catalog",
+        "build_knn_catalog_rows",
+    ),
+    "correlation": (
+        "models.correlation_model",
+        "find_similar_books_correlation",
+        "get_correlation_catalog",
+        "build_correlation_catalog_rows",
+    ),
+    "content": (
+        "models.content_model",
+        "find_similar_books_content",
+        "get_content_catalog",
+        "build_content_catalog_rows",
+    ),
+    "description": (
+        "models.content_model",
+        "find_books_by_description",
+        "get_content_catalog",
+        "build_content_catalog_rows",
+    ),
+    "description_fts": (
+        "models.fts_model",
+        "find_books_by_description_fts",
+        "get_fts_cards",
+        None,
+    ),
+    "reader": (
+        "models.reader_model",
+        "find_books_for_reader",
+        "get_reader_catalog",
+        "get_reader_catalog_rows",
+    ),
+    "popular": (
+        "models.popularity_model",
+        "find_popular_books",
+        "get_popular_catalog",
+        "build_popularity_catalog_rows",
+    ),
+}
+
+# Description search backend: "tfidf" keeps the fitted TF-IDF model in memory,
+# "fts" ranks with BM25 over an on-disk SQLite FTS5 index
+DESCRIPTION_BACKEND = os.environ.get("BOOKR_DESCRIPTION_BACKEND", "tfidf")
+DESCRIPTION_MODELS = {"tfidf": "description", "fts": "description_fts"}
+
+
+def _load(model_id, position):
+    module_name = MODEL_REGISTRY[model_id][0]
+    return getattr(
+        importlib.import_module(module_name), MODEL_REGISTRY[model_id][position]
+    )
+
+
+def get_recommender(model_id):
+    from models.executor import get_query_executor, query_key
+
+    recommend = _load(model_id, 1)
+
+    # Queries go through the shared executor, which coalesces identical ones
+    # and falls back to popular books when it is overloaded
+    def run(query, n=10):
+        return get_query_executor().run(
+            query_key(model_id, query, n),
+            recommend,
+            query,
+            n,
+            fallback=lambda: find_degraded_books(n),
+        )
+
+    return run
+
+
+def fetch_more(cursor, n=10):
+    from models.executor import get_query_executor
+
+    # A refill can score the whole catalog again, so it takes a slot like a new
+    # query. The cursor itself is the key: only repeated clicks on the same
+    # results are coalesced, and a shed refill leaves the cursor where it was.
+    return get_query_executor().run(
+        ("more", id(cursor), n),
+        cursor.fetch,
+        n,
+        fallback=find_degraded_page,
+    )
+
+
+def find_degraded_books(n=10):
+    import streamlit as st
+
+    st.warning("The server is busy, showing popular books instead")
+    return _load("popular", 1)(None, n)
+
+
+def find_degraded_page():
+    import streamlit as st
+
+    st.warning("The server is busy, please try Show More again in a moment")
+    return None
+
+
+def get_catalog(model_id):
+    return _load(model_id, 2)()
+
+
+def get_catalog_rows(model_id):
+    return _load(model_id, 3)()
+
+
+def get_cards(model_id, codes, columns):
+    if MODEL_REGISTRY[model_id][3] is None:
+        return _load(model_id, 2)(codes)
+
+    catalog = get_catalog(model_id)
+    rows = get_catalog_rows(model_id)[codes]
+
+    return catalog.iloc[rows][
+        [column for column in columns if column in catalog.columns]
+    ].reset_index(drop=True)
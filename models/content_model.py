@@ -2,104 +2,200 @@ import pandas as pd
 import numpy as np
 from sklearn.metrics.pairwise import sigmoid_kernel, cosine_similarity
 import streamlit as st
-from utils.data_loader import preprocess_for_content_based
+from utils.data_loader import (
+    DATASET_PATHS,
+    content_text,
+    preprocess_for_content_based,
+)
+from utils.id_dictionary import build_id_dictionary
+from utils.model_registry import registered
+from utils.title_resolver import TitleResolver, resolve_book_title
+from models.results import ResultCursor
+from models.sharding import SHARD_COUNT, ShardedIndex, shard_searcher, with_shards
+
+# sigmoid_kernel score of two books sharing no terms, tanh(coef0)
+NO_OVERLAP_SCORE = float(np.tanh(1.0))
+
+
+# Catalog, title lookup and fitted vectorizer, everything but the TF-IDF rows
+@registered("content_index", persist=True, sources=DATASET_PATHS, version=3)
+def build_content_index():
+    try:
+        books_df, indices, tfv = preprocess_for_content_based()
+
+        if books_df.empty or indices is None or tfv is None:
+            st.error("Failed to preprocess data for content-based filtering")
+            return None, None, None
+
+        books_df["isbn_id"] = build_id_dictionary().encode_isbns(books_df["ISBN"])
+
+        return books_df, indices, tfv
+    except Exception as e:
+        st.error(f"Error building content model: {e}")
+        return None, None, None
+
 
+def build_content_rows(start, end):
+    books_df, _, tfv = build_content_index()
+    return tfv.transform(content_text(books_df.iloc[start:end]))
 
-@st.cache_resource
+
+@registered("content", persist=True, sources=DATASET_PATHS, version=2)
 def build_content_model():
     try:
-        books_df, tfidf_matrix, indices, tfv = preprocess_for_content_based()
+        books_df, _, _ = build_content_index()
 
-        if books_df.empty or tfidf_matrix is None or indices is None or tfv is None:
-            st.error("Failed to preprocess data for content-based filtering")
-            return None, None, None, None
+        if books_df is None:
+            return None
 
-        return books_df, tfidf_matrix, indices, tfv
+        return build_content_rows(0, len(books_df))
     except Exception as e:
         st.error(f"Error building content model: {e}")
-        return None, None, None, None
+        return None
+
+
+# Loaded in each shard worker, the full TF-IDF matrix is never built there
+@registered("content_shard", persist=True, sources=DATASET_PATHS)
+def load_content_shard(start, end):
+    return build_content_rows(start, end)
+
+
+@registered("content_title_resolver", parent="content_index")
+def build_content_title_resolver():
+    books_df, indices, _ = build_content_index()
+
+    if books_df is None or indices is None:
+        return None
+
+    return TitleResolver(indices.index, books_df.loc[indices.values, "ratings_count"])
+
+
+@registered("content_catalog_rows", parent="content_index")
+def build_content_catalog_rows():
+    books_df, _, _ = build_content_index()
+    return build_id_dictionary().catalog_rows(books_df["isbn_id"])
+
+
+# TF-IDF rows split across worker processes, used when BOOKR_SHARDS > 1
+@registered("content_shards", parent="content_index", release=ShardedIndex.close)
+def build_content_shards(n_shards=SHARD_COUNT):
+    books_df, _, tfv = build_content_index()
+    return ShardedIndex(
+        load_content_shard, len(books_df), len(tfv.vocabulary_), n_shards
+    )
 
 
-def get_content_recommendations(book_title, n=10):
+def get_content_catalog():
+    return build_content_index()[0]
+
+
+def score_content(query_vector):
+    tfidf_matrix = build_content_model()
+
+    # One row of the sigmoid kernel instead of the full N x N matrix
+    return sigmoid_kernel(query_vector, tfidf_matrix).ravel()
+
+
+def score_description(query_vector):
+    tfidf_matrix = build_content_model()
+    return cosine_similarity(query_vector, tfidf_matrix).ravel()
+
+
+def get_content_cursor(book_title):
     try:
-        books_df, tfidf_matrix, indices, _ = build_content_model()
+        books_df, indices, _ = build_content_index()
 
-        if books_df is None or tfidf_matrix is None or indices is None:
+        if books_df is None or indices is None:
             st.error("Failed to build content model")
-            return pd.DataFrame()
-
-        if book_title not in indices:
-            st.error(f"Book '{book_title}' not found in the dataset")
-            # Try partial matching
-            matching_titles = [
-                title for title in indices.index if book_title.lower() in title.lower()
-            ]
-            if matching_titles:
-                book_title = matching_titles[0]
-                st.info(f"Using '{book_title}' for recommendations")
-            else:
-                return pd.DataFrame()
+            return ResultCursor("content")
+
+        book_title = resolve_book_title(build_content_title_resolver(), book_title)
+        if book_title is None:
+            return ResultCursor("content")
 
         idx = indices[book_title]
 
         if isinstance(idx, pd.Series) or isinstance(idx, np.ndarray):
             idx = idx.iloc[0]
 
-        # Calculate similarity scores
-        sig = sigmoid_kernel(tfidf_matrix, tfidf_matrix)
-        sig_scores = list(enumerate(sig[idx]))
-
-        sig_scores = sorted(sig_scores, key=lambda x: x[1], reverse=True)
-
-        sig_scores = sig_scores[1 : n + 1]
-
-        book_indices = [i[0] for i in sig_scores]
-
-        recommendations = books_df.iloc[book_indices]
+        if SHARD_COUNT > 1:
+            return ResultCursor(
+                "content",
+                query=with_shards(
+                    "content_shards", build_content_shards, lambda s: s.row(idx)
+                ),
+                exclude=[idx],
+                item_ids=books_df["isbn_id"].to_numpy(),
+                searcher=shard_searcher(
+                    "content_shards",
+                    build_content_shards,
+                    "sigmoid",
+                    min_score=NO_OVERLAP_SCORE,
+                ),
+            )
 
-        recommendations["similarity_score"] = [score[1] for score in sig_scores]
+        tfidf_matrix = build_content_model()
+        if tfidf_matrix is None:
+            st.error("Failed to build content model")
+            return ResultCursor("content")
 
-        return recommendations
+        return ResultCursor(
+            "content",
+            score_content,
+            tfidf_matrix[idx],
+            exclude=[idx],
+            item_ids=books_df["isbn_id"].to_numpy(),
+            min_score=NO_OVERLAP_SCORE,
+        )
 
     except Exception as e:
         st.error(f"Error getting content recommendations: {e}")
-        return pd.DataFrame()
+        return ResultCursor("content")
 
 
-def recommend_from_description(description, n=10):
+def get_description_cursor(description):
     try:
-        books_df, tfidf_matrix, _, tfv = build_content_model()
+        books_df, _, tfv = build_content_index()
 
-        if books_df is None or tfidf_matrix is None or tfv is None:
+        if books_df is None or tfv is None:
             st.error("Failed to build content model")
-            return pd.DataFrame()
+            return ResultCursor("description")
 
         user_vector = tfv.transform([description])
 
-        similarities = cosine_similarity(user_vector, tfidf_matrix).flatten()
-
-        top_indices = similarities.argsort()[-n:][::-1]
-
-        recommendations = books_df.iloc[top_indices].copy()
-
-        recommendations["similarity_score"] = similarities[top_indices]
+        if SHARD_COUNT > 1:
+            return ResultCursor(
+                "description",
+                query=user_vector,
+                item_ids=books_df["isbn_id"].to_numpy(),
+                searcher=shard_searcher(
+                    "content_shards", build_content_shards, "linear", min_score=0.0
+                ),
+            )
 
-        return recommendations
+        return ResultCursor(
+            "description",
+            score_description,
+            user_vector,
+            item_ids=books_df["isbn_id"].to_numpy(),
+            min_score=0.0,
+        )
 
     except Exception as e:
         st.error(f"Error getting recommendations from description: {e}")
-        return pd.DataFrame()
+        return ResultCursor("description")
 
 
 def find_similar_books_content(book_title, n=10):
     if not book_title:
         st.warning("Please enter a book title")
-        return pd.DataFrame()
+        return ResultCursor("content")
 
     with st.spinner(
         f"Finding books similar to '{book_title}' using content analysis..."
     ):
-        recommendations = get_content_recommendations(book_title, n)
+        recommendations = get_content_cursor(book_title)
+        recommendations.fetch(n)
 
         if not recommendations.empty:
             st.success(
@@ -113,10 +209,11 @@ def find_books_by_description(description, n=10):
 
     if not description:
         st.warning("Please enter a description")
-        return pd.DataFrame()
+        return ResultCursor("description")
 
     with st.spinner("Finding books matching your description..."):
-        recommendations = recommend_from_description(description, n)
+        recommendations = get_description_cursor(description)
+        recommendations.fetch(n)
 
         if not recommendations.empty:
             st.success(f"Found {len(recommendations)} books matching your description")
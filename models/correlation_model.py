@@ -1,45 +1,68 @@
 import pandas as pd
 import numpy as np
 import streamlit as st
-from utils.data_loader import load_books_data, load_ratings_data, calculate_weighted_hybrid
+from utils.data_loader import (
+    DATASET_PATHS,
+    load_books_data,
+    calculate_weighted_hybrid,
+    stream_rating_stats,
+    stream_rating_triplets,
+    pivot_rating_triplets,
+)
+from utils.id_dictionary import build_id_dictionary
+from utils.model_registry import registered
+from utils.title_resolver import TitleResolver, resolve_book_title
+from models.results import ResultCursor
 
 
 # Create the correlation matrix for book recommendations
-@st.cache_resource
+@registered("correlation", persist=True, sources=DATASET_PATHS, version=2)
 def build_correlation_matrix(popularity_threshold=100):
 
     try:
-        ratings_df = load_ratings_data()
+        dictionary = build_id_dictionary()
         books_df = load_books_data()
+        books_df["isbn_id"] = dictionary.encode_isbns(books_df["ISBN"])
 
-        df = pd.merge(ratings_df, books_df, on="ISBN")
-        
-        ratings_with_count = pd.DataFrame(df.groupby("ISBN")["Book-Rating"].mean())
-        ratings_with_count["ratings_count"] = pd.DataFrame(
-            df.groupby("ISBN")["Book-Rating"].count()
-        )
+        counts, sums = stream_rating_stats(dictionary)
+        counts[~dictionary.isbn_mask(books_df["isbn_id"])] = 0
+
+        popular = np.nonzero(counts > popularity_threshold)[0]
 
-        ratings_with_count = ratings_with_count[
-            ratings_with_count["ratings_count"] > popularity_threshold
-        ]
+        ratings_with_count = pd.DataFrame(
+            {
+                "isbn_id": popular.astype(np.int32),
+                "average_rating": sums[popular] / counts[popular],
+                "ratings_count": counts[popular],
+            }
+        )
 
         # Calculate Weighted Hybrid Rating
-        ratings_with_count.rename(columns={'Book-Rating': 'average_rating'}, inplace=True)
         ratings_with_count = calculate_weighted_hybrid(ratings_with_count)
-        
-        books_df = books_df.merge(ratings_with_count, on='ISBN')
 
-        df = df[df["ISBN"].isin(ratings_with_count.index)]
+        books_df = books_df.merge(ratings_with_count, on="isbn_id")
 
-        ratings_with_count.rename(columns={'average_rating': 'Book-Rating'}, inplace=True)
-        book_matrix = df.pivot_table(
-            index="User-ID", columns="ISBN", values="Book-Rating"
+        ratings_with_count = ratings_with_count.merge(
+            books_df[["isbn_id", "ISBN", "Book-Title"]].drop_duplicates("isbn_id"),
+            on="isbn_id",
+        )
+        ratings_with_count.rename(
+            columns={"average_rating": "Book-Rating"}, inplace=True
         )
 
-        ratings_with_count = ratings_with_count.merge(
-            df[["ISBN", "Book-Title"]].drop_duplicates(),
-            left_index=True,
-            right_on="ISBN",
+        # Matrix columns follow the rows of ratings_with_count
+        item_columns = np.full(dictionary.n_isbns, -1, dtype=np.int32)
+        item_columns[ratings_with_count["isbn_id"]] = np.arange(
+            len(ratings_with_count), dtype=np.int32
+        )
+
+        users, items, ratings = stream_rating_triplets(dictionary, item_columns >= 0)
+
+        book_matrix = pivot_rating_triplets(
+            users,
+            item_columns[items],
+            ratings,
+            shape=(dictionary.n_users, len(ratings_with_count)),
         )
 
         return book_matrix, ratings_with_count, books_df
@@ -48,78 +71,99 @@ def build_correlation_matrix(popularity_threshold=100):
         return None, None, None
 
 
-def get_correlation_recommendations(book_title, n=10, min_ratings=75):
-    try:
-        book_matrix, ratings_df, books_df = build_correlation_matrix()
-
-        if book_matrix is None or ratings_df is None or books_df is None:
-            st.error("Failed to build correlation matrix")
-            return pd.DataFrame()
-
-        book_isbn = None
-        for isbn, title in zip(ratings_df["ISBN"], ratings_df["Book-Title"]):
-            if title.lower() == book_title.lower():
-                book_isbn = isbn
-                break
-
-        if not book_isbn:
-            for isbn, title in zip(ratings_df["ISBN"], ratings_df["Book-Title"]):
-                if book_title.lower() in title.lower():
-                    book_isbn = isbn
-                    book_title = title
-                    st.info(f"Using '{book_title}' for recommendations")
-                    break
-
-        if not book_isbn:
-            st.error(
-                f"Book '{book_title}' not found in the dataset or doesn't have enough ratings"
-            )
-            return pd.DataFrame()
+# Pearson correlation of one column with every other column over the users who
+# rated both, matching DataFrame.corrwith on the dense pivot
+def correlate_with_column(book_matrix, column):
+    values, indicator = book_matrix
 
-        book_user_ratings = book_matrix[book_isbn]
+    raters = indicator[:, column].nonzero()[0]
+    target = values[raters, column].toarray().ravel()
 
-        similar_to_book = book_matrix.corrwith(book_user_ratings)
+    values = values[raters]
+    indicator = indicator[raters]
 
-        corr_book = pd.DataFrame(similar_to_book, columns=["Correlation"])
-        corr_book.dropna(inplace=True)
+    n = np.asarray(indicator.sum(axis=0)).ravel()
+    sum_x = indicator.T @ target
+    sum_xx = indicator.T @ (target * target)
+    sum_y = np.asarray(values.sum(axis=0)).ravel()
+    sum_yy = np.asarray(values.multiply(values).sum(axis=0)).ravel()
+    sum_xy = values.T @ target
 
-        corr_book = corr_book.merge(
-            books_df[["ISBN", "Book-Title"]].drop_duplicates(),
-            left_index=True,
-            right_on="ISBN",
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = (n * sum_xy - sum_x * sum_y) / np.sqrt(
+            (n * sum_xx - sum_x**2) * (n * sum_yy - sum_y**2)
         )
 
-        corr_book = corr_book.join(ratings_df["ratings_count"])
+    correlation[(n < 2) | ~np.isfinite(correlation)] = np.nan
 
-        recommendations = corr_book.sort_values("Correlation", ascending=False)
+    return np.clip(correlation, -1.0, 1.0)
 
-        recommendations = recommendations[recommendations["Book-Title"] != book_title]
 
-        top_recommendations = recommendations.head(n)
+@registered("correlation_title_resolver", parent="correlation")
+def build_correlation_title_resolver(popularity_threshold=100):
+    _, ratings_df, _ = build_correlation_matrix(popularity_threshold)
 
-        detailed_recommendations = []
-        for _, row in top_recommendations.iterrows():
-            book_details = books_df[books_df["ISBN"] == row["ISBN"]].iloc[0].to_dict()
-            book_details["Correlation"] = row["Correlation"]
-            book_details["ratings_count"] = row["ratings_count"]
-            detailed_recommendations.append(book_details)
+    if ratings_df is None:
+        return None
 
-        return pd.DataFrame(detailed_recommendations)
+    return TitleResolver(ratings_df["Book-Title"], ratings_df["ratings_count"])
+
+
+@registered("correlation_catalog_rows", parent="correlation")
+def build_correlation_catalog_rows(popularity_threshold=100):
+    _, _, books_df = build_correlation_matrix(popularity_threshold)
+    return build_id_dictionary().catalog_rows(books_df["isbn_id"])
+
+
+def get_correlation_catalog():
+    return build_correlation_matrix()[2]
+
+
+def score_correlation(book_column):
+    book_matrix, _, _ = build_correlation_matrix()
+    return correlate_with_column(book_matrix, book_column)
+
+
+def get_correlation_cursor(book_title, min_ratings=75):
+    try:
+        book_matrix, ratings_df, books_df = build_correlation_matrix()
+
+        if book_matrix is None or ratings_df is None or books_df is None:
+            st.error("Failed to build correlation matrix")
+            return ResultCursor("correlation")
+
+        book_title = resolve_book_title(build_correlation_title_resolver(), book_title)
+        if book_title is None:
+            return ResultCursor("correlation")
+
+        # Several editions can share a title, seed from the most rated one
+        editions = ratings_df[ratings_df["Book-Title"] == book_title]
+        book_column = ratings_df.index.get_loc(editions["ratings_count"].idxmax())
+
+        return ResultCursor(
+            "correlation",
+            score_correlation,
+            book_column,
+            exclude=np.nonzero((ratings_df["Book-Title"] == book_title).to_numpy())[0],
+            item_ids=ratings_df["isbn_id"].to_numpy(dtype=np.int32),
+            min_score=0.0,
+        )
 
     except Exception as e:
         st.error(f"Error getting correlation recommendations: {e}")
-        return pd.DataFrame()
+        return ResultCursor("correlation")
 
 
 def find_similar_books_correlation(book_title, n=10):
     if not book_title:
         st.warning("Please enter a book title")
-        return pd.DataFrame()
+        return ResultCursor("correlation")
 
     with st.spinner(
         f"Finding books similar to '{book_title}' using Pearson correlation..."
     ):
-        recommendations = get_correlation_recommendations(book_title, n)
+        recommendations = get_correlation_cursor(book_title)
+        recommendations.fetch(n)
 
         if not recommendations.empty:
             st.success(
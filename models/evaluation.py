@@ -0,0 +1,486 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from utils.data_loader import (
+    load_books_data,
+    load_ratings_data,
+    preprocess_for_content_based,
+    content_text,
+    calculate_weighted_hybrid,
+)
+
+
+# Offline evaluation of the recommendation models.
+#
+# Every model is reduced to an item-item scoring matrix over a candidate set of
+# ISBNs, so all test users can be scored with one sparse product per batch:
+#   scores = user_history[:, candidates] @ similarity + bias
+# Batches of test users are spread over a process pool.
+
+MODELS = ("knn", "correlation", "content", "popularity")
+
+
+def load_interactions(min_rating=0):
+    ratings_df = load_ratings_data()
+    books_df = load_books_data()
+
+    ratings_df = ratings_df[ratings_df["ISBN"].isin(books_df["ISBN"])]
+    ratings_df = ratings_df[ratings_df["Book-Rating"] >= min_rating]
+
+    user_codes, users = pd.factorize(ratings_df["User-ID"])
+    item_codes, items = pd.factorize(ratings_df["ISBN"])
+
+    interactions = pd.DataFrame(
+        {
+            "user": user_codes.astype(np.int32),
+            "item": item_codes.astype(np.int32),
+            "rating": ratings_df["Book-Rating"].to_numpy(dtype=np.float32),
+        }
+    ).drop_duplicates(subset=["user", "item"])
+
+    return interactions, pd.Index(users), pd.Index(items)
+
+
+def split_interactions(
+    interactions,
+    strategy="leave_one_out",
+    test_fraction=0.2,
+    min_user_ratings=5,
+    min_test_rating=1,
+    max_users=None,
+    seed=42,
+):
+    rng = np.random.default_rng(seed)
+
+    user_counts = interactions["user"].value_counts()
+    eligible_users = user_counts[user_counts >= min_user_ratings].index.to_numpy()
+
+    if max_users is not None and len(eligible_users) > max_users:
+        eligible_users = rng.choice(eligible_users, size=max_users, replace=False)
+
+    candidates = interactions[
+        interactions["user"].isin(eligible_users)
+        & (interactions["rating"] >= min_test_rating)
+    ]
+    candidates = candidates.sample(frac=1.0, random_state=seed)
+
+    if strategy == "leave_one_out":
+        test = candidates.drop_duplicates(subset="user")
+    elif strategy == "holdout":
+        rank = candidates.groupby("user").cumcount()
+        size = candidates.groupby("user")["item"].transform("size")
+        test = candidates[rank < np.maximum(1, (size * test_fraction).astype(int))]
+    else:
+        raise ValueError(f"Unknown split strategy: {strategy}")
+
+    train = interactions.drop(test.index)
+
+    return train, test
+
+
+def _top_k_rows(score_block_fn, n_rows, k, block_size=1024):
+    if n_rows == 0:
+        return csr_matrix((0, 0), dtype=np.float32)
+
+    rows, cols, vals = [], [], []
+
+    for start in range(0, n_rows, block_size):
+        block = score_block_fn(start, min(start + block_size, n_rows))
+        np.fill_diagonal(block[:, start : start + block.shape[0]], -np.inf)
+
+        kk = min(k, block.shape[1] - 1)
+        top = np.argpartition(-block, kk, axis=1)[:, :kk]
+        top_vals = np.take_along_axis(block, top, axis=1)
+        keep = np.isfinite(top_vals) & (top_vals > 0)
+
+        rows.append(np.nonzero(keep)[0] + start)
+        cols.append(top[keep])
+        vals.append(top_vals[keep])
+
+    return csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_rows, n_rows),
+        dtype=np.float32,
+    )
+
+
+def _popular_items(train, popularity_threshold):
+    item_counts = train["item"].value_counts()
+    return np.sort(
+        item_counts[item_counts >= popularity_threshold].index.to_numpy(np.int32)
+    )
+
+
+def _item_user_matrix(train, items, n_users, values):
+    sub = train[train["item"].isin(items)]
+    rows = np.searchsorted(items, sub["item"].to_numpy())
+    return csr_matrix(
+        (values(sub), (rows, sub["user"].to_numpy())),
+        shape=(len(items), n_users),
+        dtype=np.float32,
+    )
+
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return csr_matrix(matrix.multiply(1.0 / norms[:, None]))
+
+
+def build_knn_scorer(train, n_users, popularity_threshold=100, n_neighbors=20):
+    items = _popular_items(train, popularity_threshold)
+    features = _normalize_rows(
+        _item_user_matrix(train, items, n_users, lambda df: df["rating"].to_numpy())
+    )
+
+    similarity = _top_k_rows(
+        lambda a, b: (features[a:b] @ features.T).toarray(), len(items), n_neighbors
+    )
+
+    return items, similarity, None
+
+
+def build_correlation_scorer(
+    train, n_users, popularity_threshold=100, n_neighbors=20, min_ratings=10
+):
+    items = _popular_items(train, popularity_threshold)
+    sub = train[train["item"].isin(items)]
+    item_means = sub.groupby("item")["rating"].mean()
+
+    centered = _item_user_matrix(
+        train,
+        items,
+        n_users,
+        lambda df: (df["rating"] - df["item"].map(item_means)).to_numpy(),
+    )
+    raters = _item_user_matrix(
+        train, items, n_users, lambda df: np.ones(len(df), dtype=np.float32)
+    )
+    features = _normalize_rows(centered)
+
+    def score_block(a, b):
+        corr = (features[a:b] @ features.T).toarray()
+        support = (raters[a:b] @ raters.T).toarray()
+        corr[support < min_ratings] = -np.inf
+        return corr
+
+    similarity = _top_k_rows(score_block, len(items), n_neighbors)
+
+    return items, similarity, None
+
+
+def build_content_scorer(item_index, n_neighbors=20):
+    books_df, _, tfv = preprocess_for_content_based()
+    tfidf_matrix = tfv.transform(content_text(books_df))
+
+    isbns = books_df["ISBN"].astype(str).to_numpy()
+    item_codes = item_index.get_indexer(isbns)
+    known = np.nonzero(item_codes >= 0)[0]
+
+    order = np.argsort(item_codes[known])
+    items = item_codes[known][order].astype(np.int32)
+    features = _normalize_rows(tfidf_matrix[known[order]])
+
+    similarity = _top_k_rows(
+        lambda a, b: (features[a:b] @ features.T).toarray(), len(items), n_neighbors
+    )
+
+    return items, similarity, None
+
+
+def build_popularity_scorer(train, popularity_threshold=100, rating_weight=0.5):
+    stats = train.groupby("item")["rating"].agg(["mean", "count"])
+    stats.columns = ["average_rating", "ratings_count"]
+    stats = stats[stats["ratings_count"] >= popularity_threshold]
+    if stats.empty:
+        return np.array([], dtype=np.int32), None, np.array([], dtype=np.float32)
+
+    stats = calculate_weighted_hybrid(stats.reset_index(), rating_weight)
+    stats = stats.sort_values("item")
+
+    items = stats["item"].to_numpy(np.int32)
+    return items, None, stats["score"].to_numpy(np.float32)
+
+
+# Worker state, set once per process by the pool initializer
+_state = {}
+
+
+def _init_worker(history, items, similarity, bias, test_users, test_items, k):
+    _state["history"] = history[:, items].tocsr()
+    _state["items"] = items
+    _state["similarity"] = similarity
+    _state["bias"] = bias
+    _state["test_users"] = test_users
+    _state["test_items"] = test_items
+    _state["k"] = k
+
+
+def _score_batch(user_slice):
+    history = _state["history"]
+    items = _state["items"]
+    similarity = _state["similarity"]
+    bias = _state["bias"]
+    k = _state["k"]
+
+    users = _state["test_users"][user_slice]
+    held_out = _state["test_items"][user_slice]
+
+    seen = history[users]
+    if similarity is not None:
+        scores = (seen @ similarity).toarray()
+    else:
+        scores = np.zeros((len(users), len(items)), dtype=np.float32)
+    if bias is not None:
+        scores += bias
+
+    scores[seen.nonzero()] = -np.inf
+
+    kk = min(k, scores.shape[1])
+    top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    top = np.where(np.isfinite(top_scores), items[top], -1)
+
+    hits = np.zeros(len(users), dtype=np.float64)
+    ndcg = np.zeros(len(users), dtype=np.float64)
+    discounts = 1.0 / np.log2(np.arange(2, kk + 2))
+
+    for row, relevant in enumerate(held_out):
+        matched = np.isin(top[row], relevant)
+        if matched.any():
+            hits[row] = 1.0
+            ideal = discounts[: min(len(relevant), kk)].sum()
+            ndcg[row] = discounts[matched].sum() / ideal
+
+    recommended = np.unique(top[top >= 0])
+
+    return hits.sum(), ndcg.sum(), recommended
+
+
+def evaluate_scorer(
+    history,
+    items,
+    similarity,
+    bias,
+    test,
+    k=10,
+    workers=None,
+    batch_size=512,
+    catalog_size=None,
+):
+    test = test.sort_values("user")
+    test_users, starts = np.unique(test["user"].to_numpy(np.int32), return_index=True)
+    test_items = np.empty(len(test_users), dtype=object)
+    test_items[:] = np.split(test["item"].to_numpy(np.int32), starts[1:])
+
+    slices = [
+        slice(start, start + batch_size)
+        for start in range(0, len(test_users), batch_size)
+    ]
+    workers = workers or os.cpu_count()
+
+    hits, ndcg, recommended = 0.0, 0.0, set()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(history, items, similarity, bias, test_users, test_items, k),
+    ) as pool:
+        for batch_hits, batch_ndcg, batch_recommended in pool.map(
+            _score_batch, slices
+        ):
+            hits += batch_hits
+            ndcg += batch_ndcg
+            recommended.update(batch_recommended.tolist())
+
+    n_users = max(len(test_users), 1)
+    catalog_size = catalog_size or history.shape[1]
+
+    # Coverage is measured against the whole catalog, so it can be compared
+    # across models and popularity thresholds
+    return {
+        "users": len(test_users),
+        f"hit_rate@{k}": hits / n_users,
+        f"ndcg@{k}": ndcg / n_users,
+        "coverage": len(recommended) / max(catalog_size, 1),
+        "candidate_items": len(items),
+        "catalog_size": catalog_size,
+    }
+
+
+def _build_scorer(model, params, train, n_users, item_index):
+    if model == "knn":
+        return build_knn_scorer(
+            train, n_users, params["popularity_threshold"], params["n_neighbors"]
+        )
+    if model == "correlation":
+        return build_correlation_scorer(
+            train,
+            n_users,
+            params["popularity_threshold"],
+            params["n_neighbors"],
+            params["min_ratings"],
+        )
+    if model == "content":
+        return build_content_scorer(item_index, params["n_neighbors"])
+    if model == "popularity":
+        return build_popularity_scorer(
+            train, params["popularity_threshold"], params["rating_weight"]
+        )
+    raise ValueError(f"Unknown model: {model}")
+
+
+def _param_grid(model, grid):
+    keys = {
+        "knn": ["popularity_threshold", "n_neighbors"],
+        "correlation": ["popularity_threshold", "n_neighbors", "min_ratings"],
+        "content": ["n_neighbors"],
+        "popularity": ["popularity_threshold", "rating_weight"],
+    }[model]
+
+    for values in itertools.product(*(grid[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+
+def run_sweep(
+    models=MODELS,
+    grid=None,
+    k=10,
+    strategy="leave_one_out",
+    test_fraction=0.2,
+    min_user_ratings=5,
+    max_users=None,
+    workers=None,
+    seed=42,
+):
+    grid = {
+        "popularity_threshold": [100],
+        "n_neighbors": [20],
+        "min_ratings": [10],
+        "rating_weight": [0.5],
+        **(grid or {}),
+    }
+
+    interactions, users, item_index = load_interactions()
+    train, test = split_interactions(
+        interactions,
+        strategy=strategy,
+        test_fraction=test_fraction,
+        min_user_ratings=min_user_ratings,
+        max_users=max_users,
+        seed=seed,
+    )
+
+    history = csr_matrix(
+        (
+            np.ones(len(train), dtype=np.float32),
+            (train["user"].to_numpy(), train["item"].to_numpy()),
+        ),
+        shape=(len(users), len(item_index)),
+    )
+
+    results = []
+    for model in models:
+        for params in _param_grid(model, grid):
+            start = time.perf_counter()
+            items, similarity, bias = _build_scorer(
+                model, params, train, len(users), item_index
+            )
+            build_time = time.perf_counter() - start
+
+            # Settings that leave no candidate items are reported without scores
+            if len(items) == 0:
+                results.append(
+                    {
+                        "model": model,
+                        **params,
+                        "users": test["user"].nunique(),
+                        "candidate_items": 0,
+                        "catalog_size": len(item_index),
+                        "build_time_s": build_time,
+                    }
+                )
+                continue
+
+            start = time.perf_counter()
+            metrics = evaluate_scorer(
+                history,
+                items,
+                similarity,
+                bias,
+                test,
+                k=k,
+                workers=workers,
+                catalog_size=len(item_index),
+            )
+            query_time = time.perf_counter() - start
+
+            results.append(
+                {
+                    "model": model,
+                    **params,
+                    **metrics,
+                    "build_time_s": build_time,
+                    "query_time_s": query_time,
+                    "query_ms_per_user": 1000 * query_time / max(metrics["users"], 1),
+                }
+            )
+
+    return pd.DataFrame(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline evaluation of the book recommendation models"
+    )
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=MODELS)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--split", default="leave_one_out", choices=["leave_one_out", "holdout"]
+    )
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--min-user-ratings", type=int, default=5)
+    parser.add_argument("--max-users", type=int, default=None)
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[100])
+    parser.add_argument("--neighbors", type=int, nargs="+", default=[20])
+    parser.add_argument("--min-ratings", type=int, nargs="+", default=[10])
+    parser.add_argument("--weights", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Write results to a CSV file")
+    args = parser.parse_args()
+
+    results = run_sweep(
+        models=args.models,
+        grid={
+            "popularity_threshold": args.thresholds,
+            "n_neighbors": args.neighbors,
+            "min_ratings": args.min_ratings,
+            "rating_weight": args.weights,
+        },
+        k=args.k,
+        strategy=args.split,
+        test_fraction=args.test_fraction,
+        min_user_ratings=args.min_user_ratings,
+        max_users=args.max_users,
+        workers=args.workers,
+        seed=args.seed,
+    )
+
+    print(results.to_string(index=False))
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
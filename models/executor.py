@@ -0,0 +1,169 @@
+import copy
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+
+import streamlit as st
+
+# Heavy queries scored at the same time across all sessions
+MAX_CONCURRENT_QUERIES = int(os.environ.get("BOOKR_MAX_CONCURRENT_QUERIES", 2))
+
+# Queries allowed to wait for a free slot, beyond that new queries are shed
+MAX_QUEUED_QUERIES = int(os.environ.get("BOOKR_MAX_QUEUED_QUERIES", 8))
+
+# Seconds a query waits for a slot or for an identical in-flight query before
+# it falls back to degraded results
+QUERY_TIMEOUT = float(os.environ.get("BOOKR_QUERY_TIMEOUT", 30))
+
+# Recent waits kept for the wait-time percentiles
+WAIT_SAMPLES = 1000
+
+
+def query_key(model_id, query, n):
+    return model_id, " ".join(str(query).split()).casefold(), n
+
+
+# Runs recommendation queries on the calling session's script thread, so
+# spinners and messages still reach that session, but:
+#   - identical queries already in flight are not run again, later callers
+#     wait for the first one and get their own copy of its result
+#   - at most max_concurrent queries run at once, the rest queue for a slot
+#   - when the queue is full or a slot does not free up in time the query is
+#     shed and the caller's fallback is returned instead
+class QueryExecutor:
+    def __init__(
+        self,
+        max_concurrent=MAX_CONCURRENT_QUERIES,
+        max_queued=MAX_QUEUED_QUERIES,
+        timeout=QUERY_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._queued = 0
+        self._running = 0
+        self._peak_queued = 0
+        self._counts = {
+            "queries": 0,
+            "executed": 0,
+            "coalesced": 0,
+            "shed": 0,
+            "timed_out": 0,
+            "failed": 0,
+        }
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+
+    def run(self, key, fn, *args, fallback=None):
+        start = time.perf_counter()
+
+        with self._lock:
+            self._counts["queries"] += 1
+            future = self._in_flight.get(key)
+            leader = future is None and self._queued < self.max_queued
+
+            if future is not None:
+                self._counts["coalesced"] += 1
+            elif leader:
+                future = Future()
+                self._in_flight[key] = future
+                self._queued += 1
+                self._peak_queued = max(self._peak_queued, self._queued)
+            else:
+                self._counts["shed"] += 1
+
+        if future is None:
+            return self._degrade(fallback)
+
+        if not leader:
+            return self._follow(future, start, fallback)
+
+        return self._lead(key, future, start, fn, args, fallback)
+
+    def _degrade(self, fallback):
+        return fallback() if fallback else None
+
+    def _lead(self, key, future, start, fn, args, fallback):
+        acquired = self._slots.acquire(timeout=self.timeout)
+
+        with self._lock:
+            self._queued -= 1
+            self._waits.append(time.perf_counter() - start)
+
+            if acquired:
+                self._running += 1
+            else:
+                self._counts["timed_out"] += 1
+                del self._in_flight[key]
+
+        if not acquired:
+            future.set_result(None)
+            return self._degrade(fallback)
+
+        try:
+            result = fn(*args)
+        except Exception as e:
+            with self._lock:
+                self._counts["failed"] += 1
+            future.set_exception(e)
+            raise
+        except BaseException:
+            # Streamlit's rerun and stop requests belong to the leader's
+            # session only, followers degrade instead of re-raising them
+            future.set_result(None)
+            raise
+        finally:
+            with self._lock:
+                self._running -= 1
+                del self._in_flight[key]
+            self._slots.release()
+
+        with self._lock:
+            self._counts["executed"] += 1
+        future.set_result(result)
+
+        return copy.copy(result)
+
+    def _follow(self, future, start, fallback):
+        try:
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            result = None
+            with self._lock:
+                self._counts["timed_out"] += 1
+        except Exception:
+            result = None
+
+        with self._lock:
+            self._waits.append(time.perf_counter() - start)
+
+        if result is None:
+            return self._degrade(fallback)
+
+        return copy.copy(result)
+
+    def metrics(self):
+        with self._lock:
+            waits = sorted(wait * 1000 for wait in self._waits)
+
+            return {
+                "running": self._running,
+                "queue_depth": self._queued,
+                "peak_queue_depth": self._peak_queued,
+                "in_flight": len(self._in_flight),
+                **self._counts,
+                "wait_p50_ms": waits[len(waits) // 2] if waits else 0.0,
+                "wait_p95_ms": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                "wait_max_ms": waits[-1] if waits else 0.0,
+            }
+
+
+# One executor shared by every session of the Streamlit server
+@st.cache_resource
+def get_query_executor():
+    return QueryExecutor()
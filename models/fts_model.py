@@ -0,0 +1,172 @@
+import os
+import re
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data_loader import (
+    CLEAN_BOOKS_PATH,
+    calculate_weighted_hybrid,
+    load_clean_books_data,
+)
+from utils.model_registry import registered
+from models.results import ResultCursor
+
+FTS_INDEX_PATH = os.path.join("artifacts", "description_fts-v2.sqlite")
+
+# Indexed columns of books_clean.csv and their BM25 weights
+FTS_COLUMNS = {
+    "title": 4.0,
+    "subtitle": 2.0,
+    "authors": 2.0,
+    "categories": 1.0,
+    "description": 1.0,
+}
+
+# Card fields stored next to the index but not searched, results are hydrated
+# from the index alone
+FTS_CARD_COLUMNS = ["ISBN", "average_rating", "score"]
+
+# Weight of the weighted hybrid score in the ranking, 0 ranks by BM25 only
+FTS_POPULARITY_WEIGHT = float(os.environ.get("BOOKR_FTS_POPULARITY_WEIGHT", 0.0))
+
+
+def create_fts_index(path=FTS_INDEX_PATH):
+    books_df = load_clean_books_data().rename(columns={"isbn10": "ISBN"})
+    if books_df.empty:
+        raise ValueError("Clean books data is not available")
+    books_df = calculate_weighted_hybrid(books_df)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    building = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(building):
+        os.remove(building)
+
+    # rowid is the row of the book in books_clean.csv
+    columns = [*FTS_COLUMNS, *FTS_CARD_COLUMNS]
+    unindexed = ", ".join(f"{column} UNINDEXED" for column in FTS_CARD_COLUMNS)
+    with sqlite3.connect(building) as connection:
+        connection.execute(
+            f"CREATE VIRTUAL TABLE books_fts USING fts5({', '.join(FTS_COLUMNS)}, "
+            f"{unindexed}, tokenize='porter unicode61 remove_diacritics 2')"
+        )
+        connection.executemany(
+            f"INSERT INTO books_fts (rowid, {', '.join(columns)}) "
+            f"VALUES (?, {', '.join('?' * len(columns))})",
+            zip(
+                range(len(books_df)),
+                *(books_df[column].fillna("").astype(str) for column in FTS_COLUMNS),
+                books_df["ISBN"].fillna("").astype(str),
+                books_df["average_rating"].astype(float),
+                books_df["score"].fillna(0.0).astype(float),
+            ),
+        )
+        connection.execute("INSERT INTO books_fts (books_fts) VALUES ('optimize')")
+    connection.close()
+
+    os.replace(building, path)
+
+
+# The index lives on disk and is shared by every process through the page
+# cache, only its path is kept in memory
+@registered("description_fts")
+def build_fts_index(path=FTS_INDEX_PATH):
+    try:
+        stale = not os.path.exists(path) or (
+            os.path.exists(CLEAN_BOOKS_PATH)
+            and os.path.getmtime(CLEAN_BOOKS_PATH) > os.path.getmtime(path)
+        )
+        if stale:
+            create_fts_index(path)
+
+        return path
+    except Exception as e:
+        st.error(f"Error building description search index: {e}")
+        return None
+
+
+def get_fts_cards(rowids):
+    path = build_fts_index()
+    rowids = [int(rowid) for rowid in rowids]
+
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = connection.execute(
+            "SELECT rowid, ISBN, title, authors, average_rating, score "
+            f"FROM books_fts WHERE rowid IN ({', '.join('?' * len(rowids))})",
+            rowids,
+        ).fetchall()
+    finally:
+        connection.close()
+
+    cards = pd.DataFrame(
+        rows, columns=["rowid", "ISBN", "title", "authors", "average_rating", "score"]
+    )
+    return cards.set_index("rowid").reindex(rowids).reset_index(drop=True)
+
+
+def fts_query(description):
+    # Any of the words may match, BM25 ranks books matching more and rarer
+    # words first. Quoting keeps FTS5 operators in the input from being parsed.
+    terms = re.findall(r"\w+", description.lower())
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+
+def search_fts(query, k, exclude=()):
+    path = build_fts_index()
+    weights = ", ".join(str(weight) for weight in FTS_COLUMNS.values())
+    exclude = set(np.asarray(exclude, dtype=np.int64).tolist())
+
+    # bm25() is negative, more negative is a better match
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = connection.execute(
+            f"SELECT rowid, -bm25(books_fts, {weights}) * (1 + ? * score) AS rank "
+            "FROM books_fts WHERE books_fts MATCH ? ORDER BY rank DESC LIMIT ?",
+            (FTS_POPULARITY_WEIGHT, query, k + len(exclude)),
+        ).fetchall()
+    finally:
+        connection.close()
+
+    rows = [row for row in rows if row[0] not in exclude][:k]
+
+    return (
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([row[1] for row in rows], dtype=np.float32),
+    )
+
+
+def get_fts_cursor(description):
+    try:
+        if build_fts_index() is None:
+            st.error("Failed to build description search index")
+            return ResultCursor("description_fts")
+
+        query = fts_query(description)
+        if not query:
+            return ResultCursor("description_fts")
+
+        return ResultCursor("description_fts", query=query, searcher=search_fts)
+
+    except Exception as e:
+        st.error(f"Error getting recommendations from description: {e}")
+        return ResultCursor("description_fts")
+
+
+def find_books_by_description_fts(description, n=10):
+
+    if not description:
+        st.warning("Please enter a description")
+        return ResultCursor("description_fts")
+
+    with st.spinner("Finding books matching your description..."):
+        recommendations = get_fts_cursor(description)
+        recommendations.fetch(n)
+
+        if not recommendations.empty:
+            st.success(f"Found {len(recommendations)} books matching your description")
+        else:
+            st.warning("No books match the words in your description")
+
+        return recommendations
@@ -1,121 +1,218 @@
+import numpy as np
 import pandas as pd
-from scipy.sparse import csr_matrix
-from sklearn.neighbors import NearestNeighbors
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 import streamlit as st
-from utils.data_loader import load_books_data, load_ratings_data, calculate_weighted_hybrid
-
-
-# Create and train the KNN model
-@st.cache_resource
-def build_knn_model(popularity_threshold=100):
+from utils.data_loader import (
+    DATASET_PATHS,
+    load_books_data,
+    calculate_weighted_hybrid,
+    stream_rating_stats,
+    stream_rating_triplets,
+    pivot_rating_triplets,
+)
+from utils.id_dictionary import build_id_dictionary
+from utils.model_registry import registered
+from utils.title_resolver import TitleResolver, resolve_book_title
+from models.results import ResultCursor
+from models.sharding import SHARD_COUNT, ShardedIndex, shard_searcher, with_shards
+
+
+# Catalog and title lookup of the KNN model, everything but the feature rows
+@registered("knn_index", persist=True, sources=DATASET_PATHS, version=2)
+def build_knn_index(popularity_threshold=100):
     try:
-        ratings_df = load_ratings_data()
+        dictionary = build_id_dictionary()
         books_df = load_books_data()
 
-        df = pd.merge(ratings_df, books_df, on="ISBN")
-
-        book_num_ratings = (
-            df.groupby(by=["Book-Title"])["Book-Rating"]
-            .count()
-            .reset_index()
-            .rename(columns={"Book-Rating": "ratings_count"})[
-                ["Book-Title", "ratings_count"]
-            ]
+        books_df["isbn_id"] = dictionary.encode_isbns(books_df["ISBN"])
+        books_df["work_id"] = np.where(
+            books_df["isbn_id"] >= 0, dictionary.isbn_works[books_df["isbn_id"]], -1
         )
 
-        df = df.merge(book_num_ratings, on="Book-Title", how="left")
+        # Aggregate per-ISBN statistics to works without merging the ratings
+        counts, sums = stream_rating_stats(dictionary)
+        in_books = dictionary.isbn_mask(books_df["isbn_id"])
+        counts[~in_books] = 0
+        sums[~in_books] = 0
 
-        rating_popular_books = df[
-            df["ratings_count"] >= popularity_threshold
-        ]
+        work_counts = np.bincount(
+            dictionary.isbn_works, weights=counts, minlength=dictionary.n_works
+        )
+        work_sums = np.bincount(
+            dictionary.isbn_works, weights=sums, minlength=dictionary.n_works
+        )
 
-        # Calculate Weighted Hybrid Rating
-        book_avg_rating = (
-            df.groupby(by=["Book-Title"])["Book-Rating"]
-            .mean()
-            .reset_index()
-            .rename(columns={"Book-Rating": "average_rating"})[
-                ["Book-Title", "average_rating"]
-            ]
+        rated = np.nonzero(work_counts > 0)[0]
+        book_stats = pd.DataFrame(
+            {
+                "work_id": rated.astype(np.int32),
+                "ratings_count": work_counts[rated],
+                "average_rating": work_sums[rated] / work_counts[rated],
+            }
         )
 
-        books_df = books_df.merge(book_num_ratings, on='Book-Title', how='left')        
-        books_df = books_df.merge(book_avg_rating, on='Book-Title', how='left')
-        
+        # Calculate Weighted Hybrid Rating
+        books_df = books_df.merge(book_stats, on="work_id", how="left")
         books_df = calculate_weighted_hybrid(books_df)
 
-        book_features_df = rating_popular_books.pivot_table(
-            index="Book-Title", columns="User-ID", values="Book-Rating"
-        ).fillna(0)
-
-        book_features_df_matrix = csr_matrix(book_features_df.values)
+        book_works = np.nonzero(work_counts >= popularity_threshold)[0].astype(np.int32)
+        book_titles = pd.Index(dictionary.decode_works(book_works), name="Book-Title")
 
-        model_knn = NearestNeighbors(metric="cosine", algorithm="brute")
-        model_knn.fit(book_features_df_matrix)
+        # Feature matrix row of every ISBN id in the catalog, -1 if not popular
+        work_rows = np.full(dictionary.n_works, -1, dtype=np.int32)
+        work_rows[book_works] = np.arange(len(book_works), dtype=np.int32)
+        isbn_rows = np.where(in_books, work_rows[dictionary.isbn_works], -1)
 
-        return model_knn, book_features_df, books_df
+        return book_titles, books_df, book_works, isbn_rows, work_counts[book_works]
 
     except Exception as e:
         st.error(f"Error building KNN model: {e}")
-        return None, None, None
+        return None, None, None, None, None
+
+
+# Rows start:end of the book x user feature matrix, only the ratings of those
+# books are read
+def build_knn_rows(start, end, popularity_threshold=100):
+    dictionary = build_id_dictionary()
+    _, _, _, isbn_rows, _ = build_knn_index(popularity_threshold)
 
+    users, items, ratings = stream_rating_triplets(
+        dictionary, (isbn_rows >= start) & (isbn_rows < end)
+    )
 
-def get_knn_recommendations(book_title, n=10):
+    book_features_matrix, _ = pivot_rating_triplets(
+        isbn_rows[items] - start,
+        users,
+        ratings,
+        shape=(end - start, dictionary.n_users),
+    )
+
+    return book_features_matrix
+
+
+# Book x user feature matrix of the KNN model, neighbours are found by brute
+# force cosine similarity against it
+@registered("knn", persist=True, sources=DATASET_PATHS, version=4)
+def build_knn_model(popularity_threshold=100):
     try:
-        model_knn, book_features_df, books_df = build_knn_model()
+        _, _, book_works, _, _ = build_knn_index(popularity_threshold)
 
-        if model_knn is None or book_features_df is None or books_df is None:
-            st.error("Failed to build KNN model")
-            return pd.DataFrame()
+        if book_works is None:
+            return None
 
-        if book_title not in book_features_df.index:
-            st.error(
-                f"Book '{book_title}' not found in the dataset or doesn't have enough ratings"
-            )
+        return build_knn_rows(0, len(book_works), popularity_threshold)
 
-            similar_titles = [
-                title
-                for title in book_features_df.index
-                if book_title.lower() in title.lower()
-            ]
-            if similar_titles:
-                st.info(f"Did you mean one of these? {', '.join(similar_titles[:5])}")
-            return pd.DataFrame()
+    except Exception as e:
+        st.error(f"Error building KNN model: {e}")
+        return None
 
-        book_idx = book_features_df.index.get_loc(book_title)
 
-        distances, indices = model_knn.kneighbors(
-            book_features_df.iloc[book_idx, :].values.reshape(1, -1),
-            n_neighbors=n + 1,  # +1 because the book itself will be included
-        )
+# Loaded in each shard worker, unit-length rows so cosine similarity is a dot
+# product. The full feature matrix is never built there.
+@registered("knn_shard", persist=True, sources=DATASET_PATHS, version=2)
+def load_knn_shard(start, end):
+    return normalize(build_knn_rows(start, end))
 
-        recommendations = []
-        for i in range(1, len(distances.flatten())):
-            book_title_rec = book_features_df.index[indices.flatten()[i]]
-            distance = distances.flatten()[i]
 
-            book_details = (
-                books_df[books_df["Book-Title"] == book_title_rec].iloc[0].to_dict()
-            )
-            book_details["similarity_score"] = (
-                1 - distance
-            )  # Convert distance to similarity score
+@registered("knn_title_resolver", parent="knn_index")
+def build_knn_title_resolver(popularity_threshold=100):
+    book_titles, _, _, _, book_counts = build_knn_index(popularity_threshold)
 
-            recommendations.append(book_details)
+    if book_titles is None:
+        return None
 
-        return pd.DataFrame(recommendations)
+    return TitleResolver(book_titles, book_counts)
+
+
+@registered("knn_item_ids", parent="knn_index")
+def build_knn_item_ids(popularity_threshold=100):
+    _, books_df, book_works, _, _ = build_knn_index(popularity_threshold)
+
+    # ISBN id of the first edition of every work in the feature matrix
+    first_rows = books_df["work_id"].drop_duplicates()
+    return books_df["isbn_id"].to_numpy(dtype=np.int32)[
+        first_rows.index[pd.Index(first_rows).get_indexer(book_works)]
+    ]
+
+
+@registered("knn_catalog_rows", parent="knn_index")
+def build_knn_catalog_rows(popularity_threshold=100):
+    _, books_df, _, _, _ = build_knn_index(popularity_threshold)
+    return build_id_dictionary().catalog_rows(books_df["isbn_id"])
+
+
+# Feature rows split across worker processes, used when BOOKR_SHARDS > 1
+@registered("knn_shards", parent="knn_index", release=ShardedIndex.close)
+def build_knn_shards(n_shards=SHARD_COUNT):
+    _, _, book_works, _, _ = build_knn_index()
+    return ShardedIndex(
+        load_knn_shard, len(book_works), build_id_dictionary().n_users, n_shards
+    )
+
+
+def get_knn_catalog():
+    return build_knn_index()[1]
+
+
+def score_knn(query_vector):
+    book_features_matrix = build_knn_model()
+    return cosine_similarity(query_vector, book_features_matrix).ravel()
+
+
+def get_knn_cursor(book_title):
+    try:
+        book_titles, books_df, _, _, book_counts = build_knn_index()
+
+        if book_titles is None or books_df is None:
+            st.error("Failed to build KNN model")
+            return ResultCursor("knn")
+
+        book_title = resolve_book_title(build_knn_title_resolver(), book_title)
+        if book_title is None:
+            return ResultCursor("knn")
+
+        # Different works can share a title, seed from the most rated one
+        title_rows = np.nonzero(book_titles == book_title)[0]
+        book_idx = title_rows[np.argmax(book_counts[title_rows])]
+
+        if SHARD_COUNT > 1:
+            return ResultCursor(
+                "knn",
+                query=with_shards(
+                    "knn_shards", build_knn_shards, lambda s: s.row(book_idx)
+                ),
+                exclude=[book_idx],
+                item_ids=build_knn_item_ids(),
+                searcher=shard_searcher("knn_shards", build_knn_shards, min_score=0.0),
+            )
+
+        book_features_matrix = build_knn_model()
+        if book_features_matrix is None:
+            st.error("Failed to build KNN model")
+            return ResultCursor("knn")
+
+        return ResultCursor(
+            "knn",
+            score_knn,
+            book_features_matrix[book_idx],
+            exclude=[book_idx],
+            item_ids=build_knn_item_ids(),
+            min_score=0.0,
+        )
     except Exception as e:
         st.error(f"Error getting KNN recommendations: {e}")
-        return pd.DataFrame()
+        return ResultCursor("knn")
 
 
 def find_similar_books_knn(book_title, n=10):
     if not book_title:
         st.warning("Please enter a book title")
-        return pd.DataFrame()
+        return ResultCursor("knn")
 
     with st.spinner(f"Finding books similar to '{book_title}' using KNN..."):
-        recommendations = get_knn_recommendations(book_title, n)
+        recommendations = get_knn_cursor(book_title)
+        recommendations.fetch(n)
 
         if not recommendations.empty:
             st.success(
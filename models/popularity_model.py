@@ -0,0 +1,46 @@
+import numpy as np
+import streamlit as st
+from utils.data_loader import load_clean_books_data, calculate_weighted_hybrid
+from utils.id_dictionary import build_id_dictionary
+from utils.model_registry import registered
+from models.results import ResultCursor
+
+
+# Books ranked by the weighted hybrid score only, cheap enough to serve when
+# the query executor sheds a heavy query
+@registered("popularity")
+def build_popularity_catalog():
+    try:
+        books_df = load_clean_books_data().rename(columns={"isbn10": "ISBN"})
+        books_df["isbn_id"] = build_id_dictionary().encode_isbns(books_df["ISBN"])
+        return calculate_weighted_hybrid(books_df)
+    except Exception as e:
+        st.error(f"Error building popularity ranking: {e}")
+        return None
+
+
+@registered("popularity_catalog_rows", parent="popularity")
+def build_popularity_catalog_rows():
+    return build_id_dictionary().catalog_rows(build_popularity_catalog()["isbn_id"])
+
+
+def get_popular_catalog():
+    return build_popularity_catalog()
+
+
+def score_popularity(_query=None):
+    return build_popularity_catalog()["score"].to_numpy(dtype=np.float32)
+
+
+def find_popular_books(_query=None, n=10):
+    if build_popularity_catalog() is None:
+        return ResultCursor("popular")
+
+    recommendations = ResultCursor(
+        "popular",
+        score_popularity,
+        item_ids=build_popularity_catalog()["isbn_id"].to_numpy(),
+    )
+    recommendations.fetch(n)
+
+    return recommendations
@@ -0,0 +1,171 @@
+import re
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+import streamlit as st
+from models.knn_model import (
+    build_knn_index,
+    build_knn_model,
+    build_knn_item_ids,
+    build_knn_catalog_rows,
+    get_knn_catalog,
+)
+from models.results import ResultCursor
+from utils.data_loader import DATASET_PATHS
+from utils.id_dictionary import build_id_dictionary
+from utils.model_registry import registered
+
+# Weight of an implicit (0) rating in a reader's history
+IMPLICIT_RATING = 5.0
+
+# Rating assumed for a liked ISBN given without one
+LIKED_RATING = 10.0
+
+
+# Item-item cosine similarity over the KNN feature matrix and the reader
+# histories it was built from
+@registered("reader", persist=True, sources=DATASET_PATHS, version=2)
+def build_reader_model(popularity_threshold=100):
+    try:
+        book_features_matrix = build_knn_model(popularity_threshold)
+        _, _, _, isbn_rows, _ = build_knn_index(popularity_threshold)
+
+        normalized = normalize(book_features_matrix)
+        item_similarity = (normalized @ normalized.T).tocsr()
+        item_similarity.setdiag(0)
+        item_similarity.eliminate_zeros()
+
+        # Reader x work ratings, 0 ratings are kept as explicit entries
+        reader_histories = book_features_matrix.T.tocsr()
+
+        return item_similarity, reader_histories, isbn_rows
+
+    except Exception as e:
+        st.error(f"Error building reader model: {e}")
+        return None, None, None
+
+
+def get_reader_catalog():
+    return get_knn_catalog()
+
+
+def get_reader_catalog_rows():
+    return build_knn_catalog_rows()
+
+
+def parse_reader_rating(isbn, rating):
+    if not rating:
+        return LIKED_RATING
+
+    try:
+        value = float(rating)
+    except ValueError:
+        value = np.nan
+
+    if not np.isfinite(value):
+        raise ValueError(f"'{rating}' is not a valid rating for ISBN {isbn}")
+
+    return value
+
+
+def parse_reader_input(reader, dictionary):
+    reader = reader.strip()
+
+    # A lone number is a User-ID unless it is an ISBN in the catalog, such as
+    # an ISBN-10 without an X
+    if reader.isdigit() and dictionary.encode_isbns([reader])[0] < 0:
+        return int(reader), []
+
+    liked_books = []
+    for entry in re.split(r"[,;\n]+", reader):
+        isbn, _, rating = entry.strip().partition(":")
+        isbn = isbn.strip()
+        if isbn:
+            liked_books.append((isbn, parse_reader_rating(isbn, rating.strip())))
+
+    return None, liked_books
+
+
+def get_reader_history(user_id=None, liked_books=()):
+    _, reader_histories, isbn_rows = build_reader_model()
+    dictionary = build_id_dictionary()
+
+    if user_id is not None:
+        user = dictionary.encode_users([user_id])[0]
+        if user < 0:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.float32)
+
+        history = reader_histories[user]
+        return history.indices, history.data
+
+    isbn_ids = dictionary.encode_isbns([isbn for isbn, _ in liked_books])
+    ratings = np.array([rating for _, rating in liked_books], dtype=np.float32)
+    rows = np.where(isbn_ids >= 0, isbn_rows[isbn_ids], -1)
+    known = rows >= 0
+
+    return rows[known].astype(np.int32), ratings[known]
+
+
+def score_reader(reader_vector):
+    item_similarity, _, _ = build_reader_model()
+
+    # One sparse product over the whole history: sum of rating x similarity
+    return (reader_vector @ item_similarity).toarray().ravel()
+
+
+def get_reader_cursor(user_id=None, liked_books=()):
+    try:
+        item_similarity, _, _ = build_reader_model()
+
+        if item_similarity is None:
+            st.error("Failed to build reader model")
+            return ResultCursor("reader")
+
+        items, ratings = get_reader_history(user_id, liked_books)
+
+        if len(items) == 0:
+            st.error(
+                "No rated books found for this reader among books with enough ratings"
+            )
+            return ResultCursor("reader")
+
+        weights = np.where(ratings > 0, ratings, IMPLICIT_RATING)
+        reader_vector = csr_matrix(
+            (weights, (np.zeros(len(items), dtype=np.int32), items)),
+            shape=(1, item_similarity.shape[0]),
+        )
+
+        return ResultCursor(
+            "reader",
+            score_reader,
+            reader_vector,
+            exclude=np.unique(items),
+            item_ids=build_knn_item_ids(),
+            min_score=0.0,
+        )
+
+    except Exception as e:
+        st.error(f"Error getting reader recommendations: {e}")
+        return ResultCursor("reader")
+
+
+def find_books_for_reader(reader, n=10):
+    if not reader:
+        st.warning("Please enter a User-ID or a list of liked ISBNs")
+        return ResultCursor("reader")
+
+    with st.spinner("Finding books for this reader..."):
+        try:
+            user_id, liked_books = parse_reader_input(reader, build_id_dictionary())
+        except ValueError as e:
+            st.error(str(e))
+            return ResultCursor("reader")
+
+        recommendations = get_reader_cursor(user_id, liked_books)
+        recommendations.fetch(n)
+
+        if not recommendations.empty:
+            st.success(f"Found {len(recommendations)} recommendations for this reader")
+
+        return recommendations
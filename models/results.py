@@ -0,0 +1,223 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Columns read by the book cards, hydrated from the model's shared catalog
+CARD_COLUMNS = [
+    "ISBN",
+    "Book-Title",
+    "title",
+    "Book-Author",
+    "authors",
+    "Book-Rating",
+    "average_rating",
+    "rating",
+    "score",
+    "weighted_avg",
+]
+
+
+# Compact per-session recommendation result. Only the model id, the ISBN ids of
+# the id dictionary (rows of the index for models that store their own card
+# fields) and the scores are kept, card fields are looked up when rendered.
+class RecommendationResult:
+    __slots__ = ("model_id", "codes", "scores")
+
+    def __init__(self, model_id, codes=(), scores=()):
+        self.model_id = model_id
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def empty(self):
+        return len(self.codes) == 0
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scores.nbytes
+
+    def hydrate(self):
+        from models import get_cards
+
+        books = get_cards(self.model_id, self.codes, CARD_COLUMNS)
+        books["similarity_score"] = self.scores
+
+        return books
+
+    def extend(self, other):
+        return RecommendationResult(
+            self.model_id,
+            np.concatenate([self.codes, other.codes]),
+            np.concatenate([self.scores, other.scores]),
+        )
+
+
+# Pages selected ahead of the one requested, so "show more" is usually served
+# from the buffer without scoring the catalog again
+PREFETCH_PAGES = 3
+
+# Score vectors of the cursors being paged through, shared by every session so
+# deeper pages only cost the selection and not another scoring pass
+SCORE_CACHE_SIZE = int(os.environ.get("BOOKR_SCORE_CACHE_SIZE", 64))
+
+
+class ScoreCache:
+    def __init__(self, max_entries=SCORE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._scores = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            scores = self._scores.get(key)
+            if scores is not None:
+                self._scores.move_to_end(key)
+            return scores
+
+    def put(self, key, scores):
+        with self._lock:
+            self._scores[key] = scores
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._scores.pop(key, None)
+
+
+score_cache = ScoreCache()
+
+_cursor_ids = itertools.count()
+
+
+def select_top(scores, k, exclude=(), min_score=None):
+    scores = np.array(scores, dtype=np.float32).ravel()
+    scores[np.asarray(exclude, dtype=np.int64)] = -np.inf
+    scores[np.isnan(scores)] = -np.inf
+    if min_score is not None:
+        scores[scores <= min_score] = -np.inf
+
+    k = min(k, np.count_nonzero(np.isfinite(scores)))
+    if k == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+
+    return top, scores[top]
+
+
+# Resumable, page-by-page recommendation stream. The cursor keeps the query
+# vector and the candidates already selected but not yet shown. The catalog is
+# scored once, the score vector is kept in the shared score cache and each
+# refill only partitions out and sorts the next block of candidates; the
+# catalog is scored again only if the vector was evicted. Candidates scoring
+# min_score or less, such as books sharing nothing with the query, are never
+# returned. A searcher that returns the top candidates directly, such as a
+# sharded index, can replace the scorer. item_ids maps the model's items, its
+# matrix rows or columns, to the ISBN ids kept in the results.
+class ResultCursor:
+    __slots__ = (
+        "scorer",
+        "searcher",
+        "query",
+        "item_ids",
+        "min_score",
+        "results",
+        "exhausted",
+        "_excluded",
+        "_buffer_items",
+        "_buffer_scores",
+        "_score_key",
+    )
+
+    def __init__(
+        self,
+        model_id,
+        scorer=None,
+        query=None,
+        exclude=(),
+        item_ids=None,
+        searcher=None,
+        min_score=None,
+    ):
+        self.scorer = scorer
+        self.searcher = searcher
+        self.query = query
+        self.item_ids = item_ids
+        self.min_score = min_score
+        self.results = RecommendationResult(model_id)
+        self.exhausted = scorer is None and searcher is None
+        self._excluded = np.asarray(exclude, dtype=np.int64)
+        if item_ids is not None:
+            # Items without an ISBN id could not be rendered
+            self._excluded = np.concatenate(
+                [self._excluded, np.nonzero(np.asarray(item_ids) < 0)[0]]
+            )
+        self._buffer_items = np.array([], dtype=np.int64)
+        self._buffer_scores = np.array([], dtype=np.float32)
+        self._score_key = next(_cursor_ids)
+
+    @property
+    def model_id(self):
+        return self.results.model_id
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def empty(self):
+        return self.results.empty
+
+    def hydrate(self):
+        return self.results.hydrate()
+
+    def _refill(self, n):
+        k = n * PREFETCH_PAGES
+
+        if self.searcher is not None:
+            top, scores = self.searcher(self.query, k, self._excluded)
+        else:
+            catalog_scores = score_cache.get(self._score_key)
+            if catalog_scores is None:
+                catalog_scores = np.asarray(
+                    self.scorer(self.query), dtype=np.float32
+                ).ravel()
+                score_cache.put(self._score_key, catalog_scores)
+
+            top, scores = select_top(catalog_scores, k, self._excluded, self.min_score)
+
+        if len(top) < k:
+            self.exhausted = True
+
+        self._buffer_items = np.concatenate([self._buffer_items, top])
+        self._buffer_scores = np.concatenate([self._buffer_scores, scores])
+        self._excluded = np.concatenate([self._excluded, top])
+
+    def fetch(self, n=10):
+        if len(self._buffer_items) < n and not self.exhausted:
+            self._refill(n - len(self._buffer_items))
+
+        items, self._buffer_items = self._buffer_items[:n], self._buffer_items[n:]
+        scores, self._buffer_scores = self._buffer_scores[:n], self._buffer_scores[n:]
+
+        if self.exhausted and len(self._buffer_items) == 0:
+            self.scorer = self.searcher = self.query = None
+            score_cache.discard(self._score_key)
+
+        codes = items if self.item_ids is None else self.item_ids[items]
+        page = RecommendationResult(self.model_id, codes, scores)
+        self.results = self.results.extend(page)
+
+        return page
+
+    @property
+    def has_more(self):
+        return not self.exhausted or len(self._buffer_items) > 0
@@ -0,0 +1,155 @@
+import heapq
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from models.results import select_top
+from utils.model_registry import get_model_registry
+
+# Number of catalog shards, 1 keeps every search in the Streamlit process
+SHARD_COUNT = int(os.environ.get("BOOKR_SHARDS", 1))
+
+
+# Shard state, set once per worker process by the executor initializer
+_shard = {}
+
+
+def _init_shard(load, start, end):
+    # The worker loads or builds its own rows, then drops whatever the loader
+    # cached on the way so only the slice stays resident
+    _shard["rows"] = load(start, end)
+    _shard["offset"] = start
+    get_model_registry().evict()
+
+
+def _shard_row(i):
+    return _shard["rows"][i - _shard["offset"]]
+
+
+def _search_shard(query, k, exclude, kernel, gamma, coef0, min_score):
+    rows, offset = _shard["rows"], _shard["offset"]
+
+    scores = np.asarray((rows @ query.T).todense()).ravel()
+    if kernel == "sigmoid":
+        scores = np.tanh(gamma * scores + coef0)
+
+    exclude = np.asarray(exclude, dtype=np.int64) - offset
+    exclude = exclude[(exclude >= 0) & (exclude < rows.shape[0])]
+
+    top, top_scores = select_top(scores, k, exclude, min_score)
+
+    return top + offset, top_scores
+
+
+# Row-partitioned index over a sparse matrix (TF-IDF rows or collaborative
+# feature rows). Each shard lives in its own worker process, a query is fanned
+# out to all of them and the per-shard top-k lists are merged.
+#
+# The matrix itself never exists in this process: `load(start, end)` is a
+# module-level function each worker calls to load or build rows start:end.
+#
+# A shard is anything with a concurrent.futures style submit(fn, *args), so
+# executors for workers on other hosts can be passed in as `shards`.
+class ShardedIndex:
+    def __init__(self, load, n_rows, n_features, n_shards=SHARD_COUNT, shards=None):
+        self.n_rows = n_rows
+        self.n_features = n_features
+        self.closed = False
+
+        if shards is not None:
+            self.shards = list(shards)
+            n_shards = len(self.shards)
+
+        self.bounds = np.linspace(0, self.n_rows, n_shards + 1).astype(int)
+
+        if shards is not None:
+            return
+
+        context = multiprocessing.get_context("spawn")
+
+        self.shards = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_shard,
+                initargs=(load, start, end),
+            )
+            for start, end in zip(self.bounds[:-1], self.bounds[1:])
+        ]
+
+    def row(self, i):
+        # One row fetched from the shard holding it, used as a query vector
+        shard = np.searchsorted(self.bounds, i, side="right") - 1
+        return self.shards[shard].submit(_shard_row, i).result()
+
+    def search(
+        self,
+        query,
+        k,
+        exclude=(),
+        kernel="linear",
+        gamma=None,
+        coef0=1.0,
+        min_score=None,
+    ):
+        gamma = gamma if gamma is not None else 1.0 / self.n_features
+
+        futures = [
+            shard.submit(
+                _search_shard, query, k, exclude, kernel, gamma, coef0, min_score
+            )
+            for shard in self.shards
+        ]
+
+        # Each shard returns its candidates in descending score order
+        merged = heapq.merge(
+            *(zip(*future.result()) for future in futures),
+            key=lambda candidate: -candidate[1],
+        )
+        top = list(zip(*itertools.islice(merged, k)))
+
+        if not top:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        return np.array(top[0], dtype=np.int64), np.array(top[1], dtype=np.float32)
+
+    def close(self):
+        self.closed = True
+        for shard in self.shards:
+            shard.shutdown(wait=False, cancel_futures=True)
+
+
+# Calls `call` with the registered index `name`, built by `build`. The index is
+# looked up on every call rather than kept by cursors in session state, so the
+# workers of an evicted index are shut down instead of staying alive.
+def with_shards(name, build, call, retries=1):
+    index = build()
+    try:
+        return call(index)
+    except BrokenProcessPool:
+        # A worker died or failed to load its rows, a broken set is never kept
+        get_model_registry().evict(name)
+        if not retries:
+            raise
+    except (CancelledError, RuntimeError):
+        # Closed by an eviction while the call was running
+        if not index.closed or not retries:
+            raise
+
+    return with_shards(name, build, call, retries - 1)
+
+
+def shard_searcher(name, build, kernel="linear", gamma=None, coef0=1.0, min_score=None):
+    def search(query, k, exclude=()):
+        return with_shards(
+            name,
+            build,
+            lambda index: index.search(
+                query, k, exclude, kernel, gamma, coef0, min_score
+            ),
+        )
+
+    return search
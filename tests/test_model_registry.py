@@ -0,0 +1,92 @@
+import numpy as np
+
+from utils.model_registry import ModelRegistry
+
+MB = 1024 * 1024
+
+
+def array_of(mb):
+    return lambda: np.zeros(int(mb * MB), dtype=np.uint8)
+
+
+def registry(budget_mb, tmp_path):
+    return ModelRegistry(budget_mb=budget_mb, artifacts_dir=str(tmp_path))
+
+
+def load_child(registry, parent_mb=1, child_mb=1):
+    # The child reads its parent while loading, which makes it a child entry
+    def load():
+        registry.get("parent", (), array_of(parent_mb))
+        return array_of(child_mb)()
+
+    return registry.get("child", (), load, parent="parent")
+
+
+def resident(registry):
+    return sorted(stat["name"] for stat in registry.stats() if stat["resident"])
+
+
+def test_evicting_a_parent_evicts_its_children(tmp_path):
+    models = registry(0, tmp_path)
+    load_child(models)
+    models.get("other", (), array_of(1))
+
+    models.evict("parent")
+
+    assert resident(models) == ["other"]
+
+
+def test_evict_all_with_parent_and_child_resident(tmp_path):
+    models = registry(0, tmp_path)
+    load_child(models)
+
+    models.evict()
+
+    assert resident(models) == []
+
+
+def test_budget_eviction_cascades_to_children(tmp_path):
+    models = registry(3.25, tmp_path)
+    load_child(models)
+    models.get("other", (), array_of(1))
+
+    # Still over budget once the parent took its child along, so the loop
+    # reaches the child's key after it was already evicted
+    models.get("next", (), array_of(2.5))
+
+    assert resident(models) == ["next"]
+
+
+def test_child_is_rebuilt_after_its_parent_is_evicted(tmp_path):
+    models = registry(0, tmp_path)
+    first = load_child(models)
+
+    models.evict("parent")
+    second = load_child(models)
+
+    assert second is not first
+    assert resident(models) == ["child", "parent"]
+
+
+def test_cached_loaders_report_their_source(tmp_path):
+    models = registry(0, tmp_path)
+    models.get("from_file", (), array_of(1), cached=lambda: True)
+    models.get("from_scratch", (), array_of(1), cached=lambda: False)
+
+    sources = {stat["name"]: stat["source"] for stat in models.stats()}
+
+    assert sources == {"from_file": "artifact", "from_scratch": "built"}
+
+
+def test_release_runs_on_eviction(tmp_path):
+    models = registry(0, tmp_path)
+    released = []
+
+    def load():
+        models.get("parent", (), array_of(1))
+        return "workers"
+
+    models.get("child", (), load, parent="parent", release=released.append)
+    models.evict("parent")
+
+    assert released == ["workers"]
@@ -1,7 +1,11 @@
+import os
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.preprocessing import MinMaxScaler
 import streamlit as st
+from utils.model_registry import registered
+
+# scipy and scikit-learn are imported inside the functions that need them so
+# that the search box can use this module without loading them at startup
 
 # Define paths to datasets
 BOOKS1_PATH = "notebooks/dataset/reviews/BX_Books - 1.csv"
@@ -9,8 +13,14 @@ BOOKS2_PATH = "notebooks/dataset/reviews/BX_Books - 2.csv"
 RATINGS_PATH = "notebooks/dataset/reviews/BX-Book-Ratings.csv"
 CLEAN_BOOKS_PATH = "notebooks/dataset/categorical/books_clean.csv"
 
+# Persisted model artifacts older than any of these are rebuilt
+DATASET_PATHS = (BOOKS1_PATH, BOOKS2_PATH, RATINGS_PATH, CLEAN_BOOKS_PATH)
 
-@st.cache_data
+# Rows read per chunk when streaming the ratings file
+RATINGS_CHUNK_SIZE = int(os.environ.get("BOOKR_RATINGS_CHUNK_SIZE", 250_000))
+
+
+@registered("books", copy=True)
 def load_books_data():
     try:
         books_df1 = pd.read_csv(BOOKS1_PATH, sep=";", encoding="latin-1")
@@ -44,7 +54,7 @@ def load_books_data():
         return pd.DataFrame()
 
 
-@st.cache_data
+@registered("ratings", copy=True)
 def load_ratings_data():
     try:
         ratings_df = pd.read_csv(RATINGS_PATH, sep=";", encoding="latin-1")
@@ -54,7 +64,71 @@ def load_ratings_data():
         return pd.DataFrame()
 
 
-@st.cache_data
+# Ratings are mapped to the int32 ids of an IdDictionary (see
+# utils/id_dictionary.py) chunk by chunk, ratings of unknown ISBNs are dropped
+def iter_ratings_chunks(dictionary, chunk_size=None):
+    for chunk in pd.read_csv(
+        RATINGS_PATH,
+        sep=";",
+        encoding="latin-1",
+        dtype={"ISBN": str},
+        chunksize=chunk_size or RATINGS_CHUNK_SIZE,
+    ):
+        items = dictionary.encode_isbns(chunk["ISBN"])
+        known = items >= 0
+
+        yield (
+            dictionary.encode_users(chunk["User-ID"].to_numpy()[known]),
+            items[known],
+            chunk["Book-Rating"].to_numpy(dtype=np.float32)[known],
+        )
+
+
+def stream_rating_stats(dictionary, chunk_size=None):
+    counts = np.zeros(dictionary.n_isbns, dtype=np.int64)
+    sums = np.zeros(dictionary.n_isbns, dtype=np.float64)
+
+    for _, items, ratings in iter_ratings_chunks(dictionary, chunk_size):
+        counts += np.bincount(items, minlength=dictionary.n_isbns)
+        sums += np.bincount(items, weights=ratings, minlength=dictionary.n_isbns)
+
+    return counts, sums
+
+
+def stream_rating_triplets(dictionary, item_mask, chunk_size=None):
+    user_parts, item_parts, rating_parts = [], [], []
+
+    for users, items, ratings in iter_ratings_chunks(dictionary, chunk_size):
+        keep = item_mask[items]
+        user_parts.append(users[keep])
+        item_parts.append(items[keep])
+        rating_parts.append(ratings[keep])
+
+    return (
+        np.concatenate(user_parts),
+        np.concatenate(item_parts),
+        np.concatenate(rating_parts),
+    )
+
+
+def pivot_rating_triplets(rows, cols, ratings, shape):
+    from scipy.sparse import csr_matrix
+
+    # Duplicate (row, col) pairs are averaged like pivot_table does. The
+    # indicator keeps track of which cells hold a rating, including 0 ratings.
+    totals = csr_matrix((ratings, (rows, cols)), shape=shape, dtype=np.float32)
+    indicator = csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=shape
+    )
+
+    values = totals.copy()
+    values.data = totals.data / indicator.data
+    indicator.data[:] = 1.0
+
+    return values, indicator
+
+
+@registered("clean_books", copy=True)
 def load_clean_books_data():
     try:
         books_df = pd.read_csv(CLEAN_BOOKS_PATH)
@@ -92,8 +166,18 @@ def create_book_matrix(min_ratings=100):
         return pd.DataFrame()
 
 
-@st.cache_data
+# Text the TF-IDF vectorizer is fitted on, one document per catalog row
+def content_text(books_df):
+    if "title" in books_df.columns:
+        return books_df["title"] + ": " + books_df["description"]
+    return books_df["Book-Title"] + ": " + books_df["description"]
+
+
+# Cached through build_content_index. Only the vectorizer is fitted here, the
+# TF-IDF rows are transformed by whoever serves them.
 def preprocess_for_content_based():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
     try:
         books_df = load_clean_books_data()
 
@@ -113,11 +197,6 @@ def preprocess_for_content_based():
         # Fill missing descriptions
         books_df["description"] = books_df["description"].fillna("")
 
-        if "title" in books_df.columns:
-            content = books_df["title"] + ": " + books_df["description"]
-        else:
-            content = books_df["Book-Title"] + ": " + books_df["description"]
-
         tfv = TfidfVectorizer(
             min_df=3,
             max_features=None,
@@ -128,7 +207,7 @@ def preprocess_for_content_based():
             stop_words="english",
         )
 
-        tfidf_matrix = tfv.fit_transform(content)
+        tfv.fit(content_text(books_df))
 
         if "title" in books_df.columns:
             indices = pd.Series(
@@ -139,11 +218,11 @@ def preprocess_for_content_based():
                 books_df.index, index=books_df["Book-Title"]
             ).drop_duplicates()
 
-        return books_df, tfidf_matrix, indices, tfv
+        return books_df, indices, tfv
 
     except Exception as e:
         st.error(f"Error preprocessing for content-based filtering: {e}")
-        return pd.DataFrame(), None, None, None
+        return pd.DataFrame(), None, None
 
 
 @st.cache_data
@@ -160,8 +239,10 @@ def get_book_titles_starting_with(prefix: str):
         return []
 
 
-def calculate_weighted_hybrid(books):
-    top500_fraction = (len(books) - 500) / len(books)
+def calculate_weighted_hybrid(books, rating_weight=0.5):
+    from sklearn.preprocessing import MinMaxScaler
+
+    top500_fraction = max(len(books) - 500, 0) / len(books)
 
     R = books["average_rating"]
     v = books["ratings_count"]
@@ -174,8 +255,11 @@ def calculate_weighted_hybrid(books):
     
     books_scaled_df = scaling.fit_transform(books[['weighted_avg', 'ratings_count']])
 
-    books[['normalized_weight_avg', 'normalized_popularity']] = pd.DataFrame(books_scaled_df)
+    books[['normalized_weight_avg', 'normalized_popularity']] = books_scaled_df
     
-    books['score'] = books['normalized_weight_avg'] * 0.5 + books['normalized_popularity'] * 0.5
+    books['score'] = (
+        books['normalized_weight_avg'] * rating_weight
+        + books['normalized_popularity'] * (1 - rating_weight)
+    )
     
     return books
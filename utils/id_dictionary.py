@@ -0,0 +1,275 @@
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.data_loader import (
+    BOOKS1_PATH,
+    BOOKS2_PATH,
+    CLEAN_BOOKS_PATH,
+    RATINGS_PATH,
+    RATINGS_CHUNK_SIZE,
+    load_books_data,
+    load_clean_books_data,
+)
+from utils.model_registry import registered
+from utils.title_resolver import normalize_title
+
+ARTIFACTS_DIR = "artifacts"
+DICTIONARY_PATH = os.path.join(ARTIFACTS_DIR, "id_dictionary-v3.npz")
+USER_IDS_PATH = os.path.join(ARTIFACTS_DIR, "user_ids.npz")
+
+# ISBNs and works come from the book catalogs only, users from the ratings
+CATALOG_PATHS = (BOOKS1_PATH, BOOKS2_PATH, CLEAN_BOOKS_PATH)
+
+
+def normalize_isbns(isbns):
+    return (
+        pd.Series(isbns, dtype=object)
+        .fillna("")
+        .astype(str)
+        .str.upper()
+        .str.replace(r"[^0-9X]", "", regex=True)
+        .to_numpy()
+    )
+
+
+def work_keys(titles, authors):
+    return np.array(
+        [
+            f"{normalize_title(title)}|{normalize_title(author)}"
+            for title, author in zip(titles, authors)
+        ],
+        dtype=object,
+    )
+
+
+def encode_titles(titles):
+    # One UTF-8 buffer and the offset of every title in it, a fixed-width
+    # string array would pad every title to the longest one
+    encoded = [str(title).encode("utf-8") for title in titles]
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(title) for title in encoded])
+
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+# Dense int32 ids for normalized ISBNs, BX User-IDs and works (normalized title
+# and author, so editions of one book share a work and different books sharing
+# a title do not). Strings are only decoded when results are rendered.
+#
+# ISBNs are kept once, as sorted ASCII bytes, and looked up by binary search.
+# User-IDs are read from the ratings dump on first use only, so models that
+# only need the book catalogs never scan it.
+class IdDictionary:
+    def __init__(self, isbns, isbn_works, title_blob, title_offsets):
+        self.isbns = np.asarray(isbns, dtype=bytes)
+        self.isbn_works = np.asarray(isbn_works, dtype=np.int32)
+        self.title_blob = np.asarray(title_blob, dtype=np.uint8)
+        self.title_offsets = np.asarray(title_offsets, dtype=np.int64)
+
+    @property
+    def users(self):
+        return build_user_ids()
+
+    @property
+    def n_isbns(self):
+        return len(self.isbns)
+
+    @property
+    def n_works(self):
+        return len(self.title_offsets) - 1
+
+    @property
+    def n_users(self):
+        return len(self.users)
+
+    def encode_isbns(self, isbns):
+        keys = normalize_isbns(isbns).astype(bytes)
+        return _search_sorted(self.isbns, keys)
+
+    def encode_users(self, user_ids):
+        return _search_sorted(self.users, np.asarray(user_ids, dtype=np.int64))
+
+    def isbn_mask(self, ids):
+        ids = np.asarray(ids)
+        mask = np.zeros(self.n_isbns, dtype=bool)
+        mask[ids[ids >= 0]] = True
+        return mask
+
+    def decode_isbns(self, ids):
+        return self.isbns[ids].astype(str)
+
+    def decode_users(self, ids):
+        return self.users[ids]
+
+    def decode_works(self, ids):
+        starts = self.title_offsets[ids]
+        ends = self.title_offsets[np.asarray(ids) + 1]
+
+        return np.array(
+            [
+                self.title_blob[start:end].tobytes().decode("utf-8")
+                for start, end in zip(starts, ends)
+            ],
+            dtype=object,
+        )
+
+    def catalog_rows(self, isbn_ids):
+        # Row of every ISBN id in a catalog, the first one where ISBNs repeat
+        # and -1 for ISBNs the catalog does not hold
+        isbn_ids = np.asarray(isbn_ids)
+        known = np.nonzero(isbn_ids >= 0)[0]
+        ids, first = np.unique(isbn_ids[known], return_index=True)
+
+        rows = np.full(self.n_isbns, -1, dtype=np.int32)
+        rows[ids] = known[first]
+
+        return rows
+
+    def save(self, path=DICTIONARY_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(
+            path,
+            isbns=self.isbns,
+            isbn_works=self.isbn_works,
+            title_blob=self.title_blob,
+            title_offsets=self.title_offsets,
+        )
+
+    @classmethod
+    def load(cls, path=DICTIONARY_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["isbns"],
+                data["isbn_works"],
+                data["title_blob"],
+                data["title_offsets"],
+            )
+
+
+def _search_sorted(values, keys):
+    # Position of every key in the sorted values, -1 for keys not in them
+    if len(values) == 0:
+        return np.full(len(keys), -1, dtype=np.int32)
+
+    codes = np.searchsorted(values, keys)
+    codes[codes == len(values)] = 0
+    return np.where(values[codes] == keys, codes, -1).astype(np.int32)
+
+
+def _is_stale(path, sources):
+    if not os.path.exists(path):
+        return True
+
+    built = os.path.getmtime(path)
+    return any(
+        os.path.exists(source) and os.path.getmtime(source) > built
+        for source in sources
+    )
+
+
+def _catalog_frames():
+    # Whichever book catalogs are present, the repository only ships
+    # books_clean.csv
+    frames = []
+
+    if os.path.exists(BOOKS1_PATH) and os.path.exists(BOOKS2_PATH):
+        books_df = load_books_data()
+        if "ISBN" in books_df.columns:
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "isbn": normalize_isbns(books_df["ISBN"]),
+                        "title": books_df["Book-Title"].to_numpy(),
+                        "author": books_df["Book-Author"].to_numpy(),
+                    }
+                )
+            )
+
+    if os.path.exists(CLEAN_BOOKS_PATH):
+        clean_books_df = load_clean_books_data()
+        if "isbn10" in clean_books_df.columns:
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "isbn": normalize_isbns(clean_books_df["isbn10"]),
+                        "title": clean_books_df["title"].to_numpy(),
+                        "author": clean_books_df["authors"].to_numpy(),
+                    }
+                )
+            )
+
+    if not frames:
+        raise ValueError("No book catalog with ISBNs is available")
+
+    return frames
+
+
+def create_id_dictionary():
+    catalog = pd.concat(_catalog_frames(), ignore_index=True)
+    catalog = catalog[catalog["isbn"] != ""].drop_duplicates("isbn")
+    catalog = catalog.sort_values("isbn", ignore_index=True)
+
+    work_codes, works = pd.factorize(work_keys(catalog["title"], catalog["author"]))
+    work_titles = (
+        pd.Series(catalog["title"].fillna("").astype(str).to_numpy())
+        .groupby(work_codes)
+        .first()
+        .to_numpy()
+    )
+
+    return IdDictionary(
+        catalog["isbn"].to_numpy().astype(bytes),
+        work_codes,
+        *encode_titles(work_titles),
+    )
+
+
+def create_user_ids(chunk_size=None):
+    users = np.array([], dtype=np.int64)
+    for chunk in pd.read_csv(
+        RATINGS_PATH,
+        sep=";",
+        encoding="latin-1",
+        usecols=["User-ID"],
+        chunksize=chunk_size or RATINGS_CHUNK_SIZE,
+    ):
+        users = np.union1d(users, chunk["User-ID"].to_numpy(dtype=np.int64))
+
+    return users
+
+
+@registered("id_dictionary", cached=lambda path: not _is_stale(path, CATALOG_PATHS))
+def build_id_dictionary(path=DICTIONARY_PATH):
+    try:
+        if not _is_stale(path, CATALOG_PATHS):
+            return IdDictionary.load(path)
+
+        dictionary = create_id_dictionary()
+        dictionary.save(path)
+
+        return dictionary
+    except Exception as e:
+        st.error(f"Error building ID dictionary: {e}")
+        return None
+
+
+# Sorted BX User-IDs, the position of a User-ID is its id
+@registered("user_ids", cached=lambda path: not _is_stale(path, (RATINGS_PATH,)))
+def build_user_ids(path=USER_IDS_PATH):
+    try:
+        if not _is_stale(path, (RATINGS_PATH,)):
+            with np.load(path, allow_pickle=False) as data:
+                return data["users"]
+
+        users = create_user_ids()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, users=users)
+
+        return users
+    except Exception as e:
+        st.error(f"Error loading User-IDs: {e}")
+        return None
@@ -1,10 +1,14 @@
 import requests
 import os
+import base64
+import threading
+import time
 from PIL import Image
 from io import BytesIO
 import streamlit as st
-import time
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 # a directory for caching images
 CACHE_DIR = "assets/image_cache"
@@ -12,10 +16,52 @@ os.makedirs(CACHE_DIR, exist_ok=True)
 
 PLACEHOLDER_PATH = "assets/placeholder.png"
 
+# Covers are stored once as display-size WebP thumbnails, widths in pixels
+THUMBNAIL_WIDTHS = {"S": 75, "M": 150, "L": 300}
+THUMBNAIL_FORMAT = "webp"
+THUMBNAIL_QUALITY = 80
+
+# Concurrent downloads when fetching the covers for a page
+COVER_FETCH_WORKERS = 4
+
+# Seconds between two requests to the cover APIs across all fetch threads, and
+# before a request to them is given up
+COVER_REQUEST_INTERVAL = 0.1
+COVER_REQUEST_TIMEOUT = 10
+
+_request_lock = threading.Lock()
+_last_request = [0.0]
+
+
+def cover_request(method, url):
+    # Concurrent fetches still respect the APIs' rate limits
+    with _request_lock:
+        wait = _last_request[0] + COVER_REQUEST_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _last_request[0] = time.monotonic()
+
+    return requests.request(method, url, timeout=COVER_REQUEST_TIMEOUT)
+
+
+def save_thumbnail(content, cache_path, size="M"):
+    width = THUMBNAIL_WIDTHS.get(size, THUMBNAIL_WIDTHS["M"])
+
+    img = Image.open(BytesIO(content))
+    img = img.convert("RGB")
+    img.thumbnail((width, width * 2))
+
+    # Other fetch threads must never see a half-written thumbnail
+    building = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    img.save(building, THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY, method=6)
+    os.replace(building, cache_path)
+
+    return cache_path
+
 @lru_cache(maxsize=100)
 def get_book_cover(isbn, size='M'):
     # Check if image is already cached
-    cache_path = os.path.join(CACHE_DIR, f"{isbn}_{size}.jpg")
+    cache_path = os.path.join(CACHE_DIR, f"{isbn}_{size}.{THUMBNAIL_FORMAT}")
     if os.path.exists(cache_path):
         return cache_path
     
@@ -23,20 +69,18 @@ def get_book_cover(isbn, size='M'):
     print("Fetching", open_lib_url)
     
     try:
-        response = requests.head(open_lib_url)
+        response = cover_request("HEAD", open_lib_url)
         if response.status_code == 200 and int(response.headers.get('Content-Length', 0)) > 1000:
             # Download and cache the image
-            img_response = requests.get(open_lib_url)
-            img = Image.open(BytesIO(img_response.content))
-            img.save(cache_path)
-            return cache_path
+            img_response = cover_request("GET", open_lib_url)
+            return save_thumbnail(img_response.content, cache_path, size)
 
     except Exception as e:
         st.error(f"Error fetching image from Open Library: {e}")
     
     try:
         google_books_url = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
-        response = requests.get(google_books_url)
+        response = cover_request("GET", google_books_url)
         data = response.json()
         
         if 'items' in data and 'imageLinks' in data['items'][0]['volumeInfo']:
@@ -49,29 +93,17 @@ def get_book_cover(isbn, size='M'):
                 img_url = image_links['thumbnail']
                 
             if img_url:
-                img_response = requests.get(img_url)
-                img = Image.open(BytesIO(img_response.content))
-                img.save(cache_path)
-                return cache_path
+                img_response = cover_request("GET", img_url)
+                return save_thumbnail(img_response.content, cache_path, size)
     except Exception as e:
         st.error(f"Error fetching image from Google Books: {e}")
     
     return PLACEHOLDER_PATH
 
-# Pre-fetch and cache multiple book covers
-@st.cache_data
-def cache_book_covers(isbns, size='M'):
-    
-    for isbn in isbns:
-        # delay to bypass rate limiting
-        time.sleep(0.1)
-        get_book_cover(isbn, size)
-
-
-def get_image_for_book(book_data):
+def get_image_for_book(book_data, size='M'):
     if 'ISBN' in book_data:
         isbn = book_data['ISBN']
-        image_path = get_book_cover(isbn)
+        image_path = get_book_cover(isbn, size)
         if image_path != PLACEHOLDER_PATH:
             return image_path
     
@@ -79,19 +111,58 @@ def get_image_for_book(book_data):
         title = book_data['Book-Title']
         try:
             search_url = f"https://www.googleapis.com/books/v1/volumes?q=intitle:{title.replace(' ', '+')}"
-            response = requests.get(search_url)
+            response = cover_request("GET", search_url)
             data = response.json()
             
             if 'items' in data and 'imageLinks' in data['items'][0]['volumeInfo']:
                 img_url = data['items'][0]['volumeInfo']['imageLinks'].get('thumbnail')
                 if img_url:
-                    cache_path = os.path.join(CACHE_DIR, f"{title.replace(' ', '_')[:30]}.jpg")
-                    
-                    img_response = requests.get(img_url)
-                    img = Image.open(BytesIO(img_response.content))
-                    img.save(cache_path)
-                    return cache_path
+                    cache_path = os.path.join(
+                        CACHE_DIR,
+                        f"{title.replace(' ', '_')[:30]}_{size}.{THUMBNAIL_FORMAT}",
+                    )
+                    if os.path.exists(cache_path):
+                        return cache_path
+
+                    img_response = cover_request("GET", img_url)
+                    return save_thumbnail(img_response.content, cache_path, size)
         except Exception as e:
             st.error(f"Error searching for book image by title: {e}")
     
     return PLACEHOLDER_PATH
+
+
+def get_placeholder_thumbnail(size='M'):
+    cache_path = os.path.join(CACHE_DIR, f"placeholder_{size}.{THUMBNAIL_FORMAT}")
+    if not os.path.exists(cache_path):
+        with open(PLACEHOLDER_PATH, "rb") as img_file:
+            save_thumbnail(img_file.read(), cache_path, size)
+    return cache_path
+
+
+@lru_cache(maxsize=512)
+def get_image_data_uri(image_path):
+    mime = "image/png" if image_path.endswith(".png") else f"image/{THUMBNAIL_FORMAT}"
+    with open(image_path, "rb") as img_file:
+        return f"data:{mime};base64,{base64.b64encode(img_file.read()).decode()}"
+
+
+# Resolve the covers for a page of books concurrently and return them as inline
+# data URIs, so the whole page can be sent to the browser in one payload
+def get_page_thumbnails(books, size='M'):
+    ctx = get_script_run_ctx()
+
+    with ThreadPoolExecutor(
+        max_workers=COVER_FETCH_WORKERS,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    ) as pool:
+        image_paths = list(pool.map(lambda book: get_image_for_book(book, size), books))
+
+    return [
+        get_image_data_uri(
+            get_placeholder_thumbnail(size)
+            if image_path == PLACEHOLDER_PATH
+            else image_path
+        )
+        for image_path in image_paths
+    ]
@@ -0,0 +1,335 @@
+import functools
+import inspect
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+MODEL_ARTIFACTS_DIR = os.path.join("artifacts", "models")
+
+# Resident size allowed for every registered model and dataset together, the
+# least recently used ones are unloaded beyond it. 0 disables the budget.
+MEMORY_BUDGET_MB = float(os.environ.get("BOOKR_MEMORY_BUDGET_MB", 2048))
+
+
+def resident_size(obj, seen=None):
+    # Deep size in bytes of arrays, sparse matrices, DataFrames, estimators and
+    # the containers holding them. Objects reachable twice are counted once.
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    # Classes, such as an estimator's dtype, are shared with the whole process
+    if isinstance(obj, type):
+        return 0
+
+    if hasattr(obj, "memory_usage"):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+
+    if hasattr(obj, "nbytes") and hasattr(obj, "dtype"):
+        size = int(obj.nbytes)
+        if obj.dtype == object:
+            size += sum(sys.getsizeof(value) for value in obj.ravel())
+        return size
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(resident_size(value, seen) for value in obj)
+
+    if isinstance(obj, dict):
+        return size + sum(
+            resident_size(key, seen) + resident_size(value, seen)
+            for key, value in obj.items()
+        )
+
+    if hasattr(obj, "__dict__"):
+        return size + resident_size(vars(obj), seen)
+
+    return size
+
+
+def _loaded(result):
+    if result is None:
+        return False
+    if isinstance(result, tuple):
+        return len(result) == 0 or result[0] is not None
+    return not getattr(result, "empty", False)
+
+
+class _Entry:
+    __slots__ = (
+        "name",
+        "args",
+        "value",
+        "size",
+        "load_time",
+        "source",
+        "loads",
+        "hits",
+        "evictions",
+        "release",
+    )
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.value = None
+        self.size = 0
+        self.load_time = 0.0
+        self.source = None
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self.release = None
+
+
+# Process-wide cache for the expensive models and datasets. Every entry records
+# its resident size, load time and hit count. When the total goes over the
+# budget the least recently used entries are unloaded, models that persist
+# their artifacts are then reloaded from disk instead of rebuilt.
+class ModelRegistry:
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB, artifacts_dir=MODEL_ARTIFACTS_DIR):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.artifacts_dir = artifacts_dir
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}
+        self._resident = OrderedDict()
+        self._children = {}
+        self._loading = threading.local()
+
+    @property
+    def resident_bytes(self):
+        return sum(entry.size for entry in self._resident.values())
+
+    def _artifact_path(self, name, args, version):
+        # The version keeps artifacts written by older model code from loading
+        suffix = "".join(f"-{arg}" for arg in args)
+        return os.path.join(self.artifacts_dir, f"{name}-v{version}{suffix}.pkl")
+
+    def _read_artifact(self, path, sources):
+        if not os.path.exists(path):
+            return None
+
+        built = os.path.getmtime(path)
+        if any(os.path.exists(s) and os.path.getmtime(s) > built for s in sources):
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def _write_artifact(self, path, value):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def get(
+        self,
+        name,
+        args,
+        load,
+        persist=False,
+        sources=(),
+        version=1,
+        parent=None,
+        cached=None,
+        release=None,
+    ):
+        key = (name, args)
+        loading = getattr(self._loading, "stack", [])
+
+        with self._lock:
+            entry = self._entries.setdefault(key, _Entry(name, args))
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+            # An entry derived from this one is evicted together with it
+            if loading and loading[-1][1] == name:
+                self._children.setdefault(key, set()).add(loading[-1][0])
+
+            if key in self._resident:
+                return self._hit(key)
+
+        # Loads of different entries run concurrently, one load per entry
+        with key_lock:
+            with self._lock:
+                if key in self._resident:
+                    return self._hit(key)
+
+            start = time.perf_counter()
+            path = self._artifact_path(name, args, version) if persist else None
+
+            value = self._read_artifact(path, sources) if persist else None
+            source = "artifact"
+            if value is None:
+                # Loaders reading a file of their own report it through cached
+                source = "built"
+                if cached is not None and cached(*args):
+                    source = "artifact"
+                self._loading.stack = loading + [(key, parent)]
+                try:
+                    value = load(*args)
+                finally:
+                    self._loading.stack = loading
+
+                if not _loaded(value):
+                    return value
+
+                if persist:
+                    try:
+                        self._write_artifact(path, value)
+                    except Exception as e:
+                        st.warning(f"Could not save {name} artifact: {e}")
+
+            load_time = time.perf_counter() - start
+            size = resident_size(value)
+
+            with self._lock:
+                entry.value = value
+                entry.size = size
+                entry.load_time = load_time
+                entry.source = source
+                entry.loads += 1
+                entry.release = release
+                self._resident[key] = entry
+                self._enforce_budget(keep=key)
+
+            return value
+
+    def _hit(self, key):
+        entry = self._resident[key]
+        entry.hits += 1
+        self._resident.move_to_end(key)
+        return entry.value
+
+    def _enforce_budget(self, keep):
+        # Called with the lock held, the entry just loaded is never evicted
+        if self.budget <= 0:
+            return
+
+        for key in list(self._resident):
+            if self.resident_bytes <= self.budget:
+                break
+            # Children of an entry evicted earlier in the loop are already gone
+            if key != keep and key in self._resident:
+                self._evict(key)
+
+    def _evict(self, key):
+        entry = self._resident.pop(key, None)
+        if entry is None:
+            return
+
+        if entry.release is not None:
+            entry.release(entry.value)
+        entry.value = None
+        entry.evictions += 1
+
+        for child in self._children.pop(key, ()):
+            self._evict(child)
+
+    def evict(self, name=None):
+        with self._lock:
+            for key in [key for key in self._resident if name in (None, key[0])]:
+                self._evict(key)
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    "name": entry.name,
+                    "args": ", ".join(str(arg) for arg in entry.args),
+                    "resident": key in self._resident,
+                    "size_mb": round(entry.size / 1024 / 1024, 1),
+                    "load_s": round(entry.load_time, 2),
+                    "source": entry.source,
+                    "loads": entry.loads,
+                    "hits": entry.hits,
+                    "evictions": entry.evictions,
+                }
+                for key, entry in self._entries.items()
+            ]
+
+    def summary(self):
+        with self._lock:
+            return {
+                "resident_mb": round(self.resident_bytes / 1024 / 1024, 1),
+                "budget_mb": round(self.budget / 1024 / 1024, 1),
+                "process_rss_mb": process_rss_mb(),
+            }
+
+
+def process_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# One registry for every session of the Streamlit server
+@st.cache_resource
+def get_model_registry():
+    return ModelRegistry()
+
+
+# Replaces @st.cache_resource / @st.cache_data on the expensive builders and
+# loaders. With copy=True callers get their own copy of the cached value, as
+# they did from @st.cache_data. Bump version when the value a persisted entry
+# returns changes shape. Lookups derived from another entry, such as title
+# resolvers and catalog rows, name it as their parent: they are evicted with
+# it and so always rebuilt from the value they were built from. Loaders that
+# keep their own file on disk pass cached(*args), true when that file is up to
+# date, so the sidebar reports where the value came from. release(value) is
+# called when the entry is evicted, to free what garbage collection does not,
+# such as worker processes.
+def registered(
+    name,
+    persist=False,
+    sources=(),
+    copy=False,
+    version=1,
+    parent=None,
+    cached=None,
+    release=None,
+):
+    def decorator(load):
+        @functools.wraps(load)
+        def wrapper(*args, **kwargs):
+            args = _bind(load, args, kwargs)
+            value = get_model_registry().get(
+                name,
+                args,
+                load,
+                persist,
+                sources,
+                version,
+                parent,
+                cached,
+                release,
+            )
+
+            if copy and value is not None and hasattr(value, "copy"):
+                return value.copy()
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def _bind(load, args, kwargs):
+    # Positional and keyword calls with the same values share one entry
+    bound = inspect.signature(load).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return tuple(bound.arguments.values())
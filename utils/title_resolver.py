@@ -0,0 +1,117 @@
+import re
+from collections import defaultdict
+
+import numpy as np
+import streamlit as st
+
+
+def normalize_title(title):
+    return re.sub(r"[^a-z0-9]+", " ", str(title).lower()).strip()
+
+
+def title_trigrams(text):
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+# Character-trigram inverted index over a set of titles. Candidates are found by
+# walking only the posting lists of the query's trigrams, scored by trigram
+# similarity and boosted by popularity.
+class TitleResolver:
+    def __init__(self, titles, popularity=None, popularity_weight=0.25):
+        self.titles = np.asarray(list(titles), dtype=object)
+        self.popularity_weight = popularity_weight
+
+        if popularity is None:
+            popularity = np.zeros(len(self.titles))
+        popularity = np.log1p(np.nan_to_num(np.asarray(popularity, dtype=float)))
+        if len(popularity) and popularity.max() > 0:
+            popularity = popularity / popularity.max()
+        self.popularity = popularity
+
+        self._exact = {}
+        postings = defaultdict(list)
+        self._gram_counts = np.zeros(len(self.titles), dtype=np.int32)
+
+        for idx, title in enumerate(self.titles):
+            normalized = normalize_title(title)
+            best = self._exact.get(normalized)
+            if best is None or self.popularity[idx] > self.popularity[best]:
+                self._exact[normalized] = idx
+
+            grams = title_trigrams(normalized)
+            self._gram_counts[idx] = len(grams)
+            for gram in grams:
+                postings[gram].append(idx)
+
+        self._postings = {
+            gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __contains__(self, title):
+        return normalize_title(title) in self._exact
+
+    def exact_match(self, title):
+        idx = self._exact.get(normalize_title(title))
+        return None if idx is None else self.titles[idx]
+
+    def suggest(self, query, k=5, min_similarity=0.3):
+        grams = title_trigrams(normalize_title(query))
+        lists = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not lists:
+            return []
+
+        ids, overlap = np.unique(np.concatenate(lists), return_counts=True)
+
+        # Jaccard handles misspellings, containment handles partial titles
+        jaccard = overlap / (len(grams) + self._gram_counts[ids] - overlap)
+        containment = overlap / len(grams)
+        similarity = 0.5 * jaccard + 0.5 * containment
+
+        keep = similarity >= min_similarity
+        ids, similarity = ids[keep], similarity[keep]
+
+        scores = similarity * (1 + self.popularity_weight * self.popularity[ids])
+
+        top = np.argsort(-scores, kind="stable")
+        seen, candidates = set(), []
+        for i in top:
+            title = self.titles[ids[i]]
+            if title not in seen:
+                seen.add(title)
+                candidates.append((title, float(scores[i])))
+            if len(candidates) == k:
+                break
+
+        return candidates
+
+    def resolve(self, query, k=5):
+        title = self.exact_match(query)
+        if title is not None:
+            return title, []
+
+        candidates = [title for title, _ in self.suggest(query, k=k)]
+        if not candidates:
+            return None, []
+
+        return candidates[0], candidates[1:]
+
+
+def resolve_book_title(resolver, book_title):
+    title, alternatives = resolver.resolve(book_title)
+
+    if title is None:
+        st.error(
+            f"Book '{book_title}' not found in the dataset or doesn't have enough ratings"
+        )
+        return None
+
+    if normalize_title(title) != normalize_title(book_title):
+        st.info(f"Using '{title}' for recommendations")
+        if alternatives:
+            st.info(f"Did you mean one of these? {', '.join(alternatives)}")
+
+    return title
@@ -1,8 +1,7 @@
 import streamlit as st
 from streamlit_searchbox import st_searchbox
-import pandas as pd
-from utils.image_fetcher import get_image_for_book
 import base64
+import html
 import math
 
 
@@ -23,11 +22,7 @@ def create_header():
     st.markdown("<hr>", unsafe_allow_html=True)
 
 
-def create_book_card(book, key=None):
-
-    if isinstance(book, pd.Series):
-        book = book.to_dict()
-
+def book_card_html(book, image_src, size="M"):
     title = book.get("Book-Title", book.get("title", "Unknown Title"))
     author = book.get("Book-Author", book.get("authors", "Unknown Author"))
     rating = book.get(
@@ -43,46 +38,63 @@ def create_book_card(book, key=None):
     )
 
     isbn = book.get("ISBN", "")
+    isbn_html = f"<p>ISBN: {html.escape(str(isbn))}</p>" if isbn else ""
+
+    # Kept on one line, indented HTML would be rendered as a markdown code block
+    return (
+        "<div class='book-card'>"
+        f"<img class='book-cover book-cover-{size}' src='{image_src}' alt='Cover'>"
+        "<div class='book-details'>"
+        f"<h4>{html.escape(str(title))}</h4>"
+        f"<p class='author'>by {html.escape(str(author))}</p>"
+        f"<p class='rating'>Average Rating: {rating}</p>"
+        f"<p class='rating'>Weighted Hybrid Score: {weighted_avg}</p>"
+        f"{isbn_html}"
+        "</div></div>"
+    )
 
-    image_path = get_image_for_book(book)
-
-    col1, col2 = st.columns([1, 3])
-
-    with col1:
-        st.image(image_path, width=150)
-
-    with col2:
-        st.markdown(f"<h4>{title}</h4>", unsafe_allow_html=True)
-        st.markdown(f"<p class='author'>by {author}</p>", unsafe_allow_html=True)
-
-        st.markdown(
-            f"<p class='rating'>Average Rating: {rating}</p>",
-            unsafe_allow_html=True,
-        )
-        st.markdown(
-            f"<p class='rating'>Weighted Hybrid Score: {weighted_avg}</p>",
-            unsafe_allow_html=True,
-        )
-        if isbn:
-            st.markdown(f"<p>ISBN: {isbn}</p>", unsafe_allow_html=True)
 
+def create_recommendation_grid(books, cols=2, size="M"):
+    import pandas as pd
 
-def create_recommendation_grid(books, cols=2):
+    # Compact result handles are hydrated with card fields only when rendered
+    if hasattr(books, "hydrate"):
+        books = books.hydrate()
 
     if isinstance(books, pd.DataFrame):
         books_list = books.to_dict("records")
     else:
         books_list = books
 
-    for i in range(0, len(books_list), cols):
-        columns = st.columns(cols)
-        for j in range(cols):
-            if i + j < len(books_list):
-                with columns[j]:
-                    with st.container():
-                        st.markdown("<div class='book-card'>", unsafe_allow_html=True)
-                        create_book_card(books_list[i + j], key=f"book_{i}_{j}")
-                        st.markdown("</div>", unsafe_allow_html=True)
+    from utils.image_fetcher import get_page_thumbnails
+
+    # All covers of the page are fetched together and inlined as thumbnails,
+    # so the grid reaches the browser as a single payload
+    image_srcs = get_page_thumbnails(books_list, size)
+
+    cards = "".join(
+        book_card_html(book, image_src, size)
+        for book, image_src in zip(books_list, image_srcs)
+    )
+    st.markdown(
+        f"<div class='book-grid' style='grid-template-columns: repeat({cols}, 1fr);'>"
+        f"{cards}</div>",
+        unsafe_allow_html=True,
+    )
+
+
+def create_show_more_button(on_click):
+    col1, col2, col3 = st.columns([1, 1, 1])
+
+    with col2:
+        show_more_button = st.button(
+            "Show More",
+            key="show_more_button",
+            on_click=on_click,
+            use_container_width=True,
+        )
+
+    return show_more_button
 
 
 def create_model_selection_buttons():
@@ -152,6 +164,29 @@ def create_description_search_box():
     return description, description_search_button
 
 
+def create_reader_search_box():
+    st.markdown(
+        "<p style='font-weight: bold;'>Get recommendations for a reader:</p>",
+        unsafe_allow_html=True,
+    )
+
+    col1, col2 = st.columns([4, 1])
+
+    with col1:
+        reader = st.text_input(
+            "",
+            key="reader",
+            placeholder="User-ID, or liked ISBNs such as 0439136350:9, 0345339681",
+        )
+
+    with col2:
+        reader_search_button = st.button(
+            "For This Reader", key="reader_search_button", use_container_width=True
+        )
+
+    return reader, reader_search_button
+
+
 def create_loading_placeholder():
     return st.empty()
 
@@ -189,6 +224,27 @@ def create_footer():
     )
 
 
+def create_query_metrics(metrics):
+    with st.sidebar:
+        st.markdown("<h3>Query Executor</h3>", unsafe_allow_html=True)
+        st.metric("Queue depth", metrics["queue_depth"])
+        st.metric("Wait p95", f"{metrics['wait_p95_ms']:.0f} ms")
+        st.json(metrics, expanded=False)
+
+
+def create_model_registry_stats(summary, stats):
+    with st.sidebar:
+        st.markdown("<h3>Model Registry</h3>", unsafe_allow_html=True)
+        st.metric(
+            "Resident models",
+            f"{summary['resident_mb']:.0f} / {summary['budget_mb']:.0f} MB",
+        )
+        if summary["process_rss_mb"] is not None:
+            st.metric("Process RSS", f"{summary['process_rss_mb']:.0f} MB")
+        if stats:
+            st.dataframe(stats, hide_index=True)
+
+
 def get_image_base64(image_path):
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode()